@@ -5,133 +5,121 @@ Frontend Flask pour ScrapingScanSante
 Interface web simple pour lancer et suivre la collecte de données
 """
 
-from flask import Flask, render_template, jsonify, send_file
+from flask import Flask, render_template, jsonify, send_file, request, Response
 import threading
-import time
 import os
 import glob
 from datetime import datetime
 import queue
 import logging
+import tempfile
 import zipfile
 from pathlib import Path
 
 # Import du script d'automation existant (sans le modifier)
 from final_automation import ScanSanteFinalAutomation
+from dashboard_aggregates import AggregateCache, manifest_fingerprint
+from search_index import SearchIndex
+from queue_logging import add_listener_handler
+from job_state import JobStateStore
 
 app = Flask(__name__)
 
-# État global de l'application
-app_state = {
-    'is_running': False,
-    'stop_requested': False,
-    'progress': 0,
-    'current_file': '',
-    'total_files': 0,
-    'successful': 0,
-    'failed': 0,
-    'start_time': None,
-    'end_time': None,
-    'logs': []
-}
+# État de la collecte partagé entre workers (SQLite) : compteurs, progression, 100 derniers logs
+# (fichier créé à la première requête, pas à l'import)
+job_state = JobStateStore(os.environ.get('SCANSANTE_STATE_DB', 'scansante_state.db'))
+
+# Agrégats pré-calculés des pages casemix / visuchir / analyse croisée
+aggregate_cache = AggregateCache('donnees_scansante')
+
+# Index de recherche des établissements (autocomplétion), mis à jour au fil de l'eau
+search_index = SearchIndex()
+search_state = {'tree_fingerprint': None, 'tree_indexed': False}
 
 # Queue pour les logs en temps réel
 log_queue = queue.Queue()
 
+# Loggers de la collecte affichés dans l'interface (data_cleaner journalise sur le
+# logger racine) : les lignes d'accès werkzeug ("GET /api/status ...") en sont exclues
+COLLECTION_LOGGERS = ('final_automation', 'root')
+
 class WebLogger(logging.Handler):
-    """Handler personnalisé pour capturer les logs et les envoyer au frontend"""
+    """Handler personnalisé pour capturer les logs et les envoyer au frontend
+
+    Attaché au QueueListener (queue_logging) : emit tourne dans le thread du
+    listener, pas dans les threads de scraping ; une insertion SQLite par log.
+    """
     def emit(self, record):
-        log_entry = {
-            'time': datetime.now().strftime('%H:%M:%S'),
-            'level': record.levelname,
-            'message': record.getMessage()
-        }
-        app_state['logs'].append(log_entry)
-        # Garder seulement les 100 derniers logs
-        if len(app_state['logs']) > 100:
-            app_state['logs'] = app_state['logs'][-100:]
-
-def run_automation_thread():
-    """Lance l'automation dans un thread séparé"""
-    try:
-        app_state['is_running'] = True
-        app_state['start_time'] = datetime.now()
-        app_state['progress'] = 0
-        app_state['logs'] = []
+        job_state.append_log(record.levelname, record.getMessage(),
+                             time=datetime.fromtimestamp(record.created).strftime('%H:%M:%S'))
+
+web_handler = WebLogger()
+web_handler.addFilter(lambda record: record.name in COLLECTION_LOGGERS)
 
+def run_automation_thread(time_budget=None):
+    """Lance l'automation dans un thread séparé
+
+    time_budget : durée maximale en secondes (None = illimitée)
+    """
+    try:
         # Créer l'instance d'automation
         automation = ScanSanteFinalAutomation()
 
-        # Ajouter notre handler personnalisé au logger
-        web_handler = WebLogger()
-        automation.logger.addHandler(web_handler)
+        # Ajouter notre handler personnalisé, côté listener du logging en file
+        automation.setup_logging()
+        add_listener_handler(web_handler)
 
         # Obtenir le nombre total de combinaisons
         combinations = automation.get_strategic_combinations()
-        app_state['total_files'] = len(combinations)
+        job_state.update(total_files=len(combinations))
 
         # Wrapper de la méthode scrape_table_data pour tracker la progression
         original_scrape = automation.scrape_table_data
 
         def tracked_scrape(params):
             # Vérifier si l'arrêt a été demandé
-            if app_state['stop_requested']:
+            if job_state.get('stop_requested'):
                 return False
 
-            app_state['current_file'] = f"{params['annee']}_{params['typrgp']}_{params['base']}"
+            job_state.update(current_file=f"{params['annee']}_{params['typrgp']}_{params['base']}")
             result = original_scrape(params)
 
             if result == True:
-                app_state['successful'] += 1
+                job_state.increment('successful')
             else:
-                app_state['failed'] += 1
+                job_state.increment('failed')
 
             # Mise à jour de la progression
-            total_processed = app_state['successful'] + app_state['failed']
-            app_state['progress'] = int((total_processed / app_state['total_files']) * 100)
+            state = job_state.snapshot()
+            total_processed = state['successful'] + state['failed']
+            # (plafonnée : les échecs critical/high sont retentés)
+            job_state.update(progress=min(100, int((total_processed / len(combinations)) * 100)))
 
             return result
 
         # Remplacer temporairement la méthode
         automation.scrape_table_data = tracked_scrape
 
-        # Wrapper pour la boucle d'automation avec vérification d'arrêt
-        original_run = automation.run_full_automation
-
-        def stoppable_run(delay=2, max_combinations=None):
-            # Code similaire à run_full_automation mais avec vérifications d'arrêt
-            combinations = automation.get_strategic_combinations()
-            if max_combinations:
-                combinations = combinations[:max_combinations]
-
-            for params in combinations:
-                # Vérifier si l'arrêt est demandé
-                if app_state['stop_requested']:
-                    automation.logger.info("Arrêt demandé par l'utilisateur")
-                    break
-
-                if not automation.validate_combination(params):
-                    continue
-
-                tracked_scrape(params)
-                time.sleep(delay)
-
-            return app_state['successful']
+        # Boucle d'automation avec vérification d'arrêt : les combinaisons passent
+        # par priorité (critical d'abord), dans la limite du budget éventuel
+        def stoppable_run(delay=2, max_combinations=None, time_budget=None):
+            return automation.run_full_automation(
+                delay=delay,
+                max_combinations=max_combinations,
+                combinations=combinations,
+                clean=False,
+                time_budget=time_budget,
+                should_stop=lambda: job_state.get('stop_requested')
+            )
 
         # Lancer l'automation avec vérification d'arrêt
-        stoppable_run(delay=2)
+        stoppable_run(delay=2, time_budget=time_budget)
 
-        app_state['end_time'] = datetime.now()
-        app_state['is_running'] = False
-        app_state['progress'] = 100
+        job_state.update(end_time=datetime.now().isoformat(timespec='seconds'), is_running=False, progress=100)
 
     except Exception as e:
-        app_state['is_running'] = False
-        app_state['logs'].append({
-            'time': datetime.now().strftime('%H:%M:%S'),
-            'level': 'ERROR',
-            'message': f'Erreur: {str(e)}'
-        })
+        job_state.update(is_running=False)
+        job_state.append_log('ERROR', f'Erreur: {str(e)}')
 
 @app.route('/')
 def index():
@@ -156,18 +144,17 @@ def analyse_croisee():
 @app.route('/api/start', methods=['POST'])
 def start_collection():
     """Démarre la collecte de données"""
-    if app_state['is_running']:
+    # Réinitialiser l'état (vérification et démarrage atomiques entre workers)
+    if not job_state.try_start():
         return jsonify({'error': 'Une collecte est déjà en cours'}), 400
 
-    # Réinitialiser l'état
-    app_state['successful'] = 0
-    app_state['failed'] = 0
-    app_state['progress'] = 0
-    app_state['current_file'] = ''
-    app_state['stop_requested'] = False
+    # Budget optionnel : {"time_budget_minutes": 30} -> données critical d'abord
+    options = request.get_json(silent=True) or {}
+    time_budget = options.get('time_budget_minutes')
+    time_budget = float(time_budget) * 60 if time_budget else None
 
     # Lancer dans un thread
-    thread = threading.Thread(target=run_automation_thread)
+    thread = threading.Thread(target=run_automation_thread, args=(time_budget,))
     thread.daemon = True
     thread.start()
 
@@ -176,15 +163,12 @@ def start_collection():
 @app.route('/api/stop', methods=['POST'])
 def stop_collection():
     """Arrête la collecte en cours"""
-    if not app_state['is_running']:
+    if not job_state.snapshot()['is_running']:
         return jsonify({'error': 'Aucune collecte en cours'}), 400
 
-    app_state['stop_requested'] = True
-    app_state['logs'].append({
-        'time': datetime.now().strftime('%H:%M:%S'),
-        'level': 'WARNING',
-        'message': 'Arrêt de la collecte demandé...'
-    })
+    # Lu par le thread de collecte, quel que soit le worker qui l'exécute
+    job_state.update(stop_requested=True)
+    job_state.append_log('WARNING', 'Arrêt de la collecte demandé...')
 
     return jsonify({'status': 'stopping'})
 
@@ -192,42 +176,32 @@ def stop_collection():
 def reset_state():
     """Réinitialise les compteurs (appelé au refresh de la page)"""
     # Toujours réinitialiser, même si une collecte est en cours
-    # (car c'est un refresh de page)
-    app_state['progress'] = 0
-    app_state['current_file'] = ''
-    app_state['total_files'] = 0
-    app_state['successful'] = 0
-    app_state['failed'] = 0
-    app_state['start_time'] = None
-    app_state['end_time'] = None
-    app_state['logs'] = []
-    app_state['stop_requested'] = False
-
-    # Si une collecte était en cours, la marquer comme stoppée
-    if app_state['is_running']:
-        app_state['is_running'] = False
+    # (car c'est un refresh de page) ; une collecte en cours est marquée stoppée
+    job_state.reset()
 
     return jsonify({'status': 'reset', 'message': 'Compteurs réinitialisés'})
 
 @app.route('/api/status')
 def get_status():
     """Retourne l'état actuel de la collecte"""
+    state = job_state.snapshot()
     elapsed_time = None
-    if app_state['start_time']:
-        if app_state['is_running']:
-            elapsed_time = str(datetime.now() - app_state['start_time']).split('.')[0]
-        elif app_state['end_time']:
-            elapsed_time = str(app_state['end_time'] - app_state['start_time']).split('.')[0]
+    if state['start_time']:
+        start_time = datetime.fromisoformat(state['start_time'])
+        if state['is_running']:
+            elapsed_time = str(datetime.now() - start_time).split('.')[0]
+        elif state['end_time']:
+            elapsed_time = str(datetime.fromisoformat(state['end_time']) - start_time).split('.')[0]
 
     return jsonify({
-        'is_running': app_state['is_running'],
-        'progress': app_state['progress'],
-        'current_file': app_state['current_file'],
-        'total_files': app_state['total_files'],
-        'successful': app_state['successful'],
-        'failed': app_state['failed'],
+        'is_running': state['is_running'],
+        'progress': state['progress'],
+        'current_file': state['current_file'],
+        'total_files': state['total_files'],
+        'successful': state['successful'],
+        'failed': state['failed'],
         'elapsed_time': elapsed_time,
-        'logs': app_state['logs'][-20:]  # Derniers 20 logs
+        'logs': job_state.recent_logs(20)  # Derniers 20 logs
     })
 
 @app.route('/api/download')
@@ -235,7 +209,8 @@ def download_file():
     """Télécharge le fichier consolidé"""
     master_file = 'scansante_master_cleaned.csv'
     if os.path.exists(master_file):
-        return send_file(master_file, as_attachment=True)
+        # Chemin absolu : send_file résout un chemin relatif depuis le dossier de l'application
+        return send_file(os.path.abspath(master_file), as_attachment=True)
     else:
         return jsonify({
             'error': 'Aucun fichier disponible',
@@ -252,7 +227,7 @@ def download_all_files():
         raw_dir = 'donnees_scansante'
 
         has_files = (os.path.exists(master_file) or
-                     (os.path.exists(cleaned_dir) and glob.glob(os.path.join(cleaned_dir, '*.csv'))) or
+                     (os.path.exists(cleaned_dir) and glob.glob(os.path.join(cleaned_dir, '**', 'cleaned_*.csv'), recursive=True)) or
                      (os.path.exists(raw_dir) and glob.glob(os.path.join(raw_dir, '**/*.csv'), recursive=True)))
 
         if not has_files:
@@ -262,7 +237,9 @@ def download_all_files():
             }), 404
 
         zip_filename = f'scansante_data_{datetime.now().strftime("%Y%m%d_%H%M%S")}.zip'
-        zip_path = os.path.join(os.getcwd(), zip_filename)
+        # Fichier temporaire unique : plusieurs téléchargements simultanés (workers, threads)
+        zip_fd, zip_path = tempfile.mkstemp(prefix='scansante_data_', suffix='.zip')
+        os.close(zip_fd)
 
         # Créer le fichier ZIP
         with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
@@ -271,13 +248,13 @@ def download_all_files():
             if os.path.exists(master_file):
                 zipf.write(master_file, arcname=f'consolidé/{os.path.basename(master_file)}')
 
-            # Ajouter tous les fichiers nettoyés individuels
+            # Ajouter tous les fichiers nettoyés individuels (arborescence miroir du brut)
             cleaned_dir = 'donnees_scansante_cleaned'
             if os.path.exists(cleaned_dir):
-                cleaned_files = glob.glob(os.path.join(cleaned_dir, 'cleaned_*.csv'))
+                cleaned_files = glob.glob(os.path.join(cleaned_dir, '**', 'cleaned_*.csv'), recursive=True)
                 for filepath in cleaned_files:
-                    arcname = f'fichiers_individuels/{os.path.basename(filepath)}'
-                    zipf.write(filepath, arcname=arcname)
+                    arcname = os.path.relpath(filepath, cleaned_dir).replace(os.sep, '/')
+                    zipf.write(filepath, arcname=f'fichiers_individuels/{arcname}')
 
             # Ajouter les fichiers bruts (optionnel)
             raw_dir = 'donnees_scansante'
@@ -308,6 +285,43 @@ def download_all_files():
     except Exception as e:
         return jsonify({'error': f'Erreur création ZIP: {str(e)}'}), 500
 
+@app.route('/api/aggregates')
+@app.route('/api/aggregates/<section>')
+def get_aggregates(section=None):
+    """Agrégats pré-calculés (national, public_prive, par_categorie, evolution)"""
+    try:
+        body = aggregate_cache.get_json(section)
+    except Exception as e:
+        return jsonify({'error': f'Erreur calcul des agrégats: {str(e)}'}), 500
+    if body is None:
+        return jsonify({'error': f'Section inconnue: {section}'}), 404
+    return Response(body, mimetype='application/json')
+
+def refresh_search_index():
+    """Indexe les nouvelles lignes du consolidé, ou à défaut l'arbre brut si son manifeste a changé"""
+    master_file = 'scansante_master_cleaned.csv'
+    if os.path.exists(master_file):
+        search_index.update_from_consolidated(master_file)
+        return
+
+    fingerprint = manifest_fingerprint('donnees_scansante')
+    if not search_state['tree_indexed'] or fingerprint != search_state['tree_fingerprint']:
+        search_index.update_from_tree('donnees_scansante')
+        search_state['tree_fingerprint'] = fingerprint
+        search_state['tree_indexed'] = True
+
+@app.route('/api/search')
+def search_establishments():
+    """Autocomplétion : établissements par nom partiel (sans accents) ou début de Finess"""
+    query = request.args.get('q', '')
+    limit = min(request.args.get('limit', 10, type=int), 50)
+    try:
+        refresh_search_index()
+    except Exception as e:
+        return jsonify({'error': f'Erreur index de recherche: {str(e)}'}), 500
+    results = search_index.search(query, limit=limit, categorie=request.args.get('categorie'))
+    return jsonify({'query': query, 'results': results})
+
 @app.route('/api/files')
 def list_files():
     """Liste tous les fichiers CSV disponibles"""
@@ -323,11 +337,12 @@ def list_files():
             'type': 'consolidé'
         })
 
-    # Fichiers nettoyés
-    cleaned_files = glob.glob('donnees_scansante_cleaned/*.csv')
+    # Fichiers nettoyés (rangés dans les mêmes sous-dossiers que les bruts)
+    cleaned_dir = 'donnees_scansante_cleaned'
+    cleaned_files = sorted(glob.glob(os.path.join(cleaned_dir, '**', 'cleaned_*.csv'), recursive=True))
     for filepath in cleaned_files[:10]:  # Limiter à 10 pour l'affichage
         files.append({
-            'name': os.path.basename(filepath),
+            'name': os.path.relpath(filepath, cleaned_dir).replace(os.sep, '/'),
             'size': os.path.getsize(filepath),
             'modified': datetime.fromtimestamp(os.path.getmtime(filepath)).strftime('%Y-%m-%d %H:%M:%S'),
             'type': 'individuel'
@@ -342,6 +357,7 @@ if __name__ == '__main__':
     print("\nAccedez a l'interface web sur:")
     print("   http://localhost:5000")
     print("\nAppuyez sur Ctrl+C pour arreter le serveur")
+    print("(serveur de developpement ; en production : python wsgi.py)")
     print("=" * 50)
 
     app.run(debug=True, host='0.0.0.0', port=5000, use_reloader=False)
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""
+Client HTTP asynchrone pour ScanSante
+Permet d'avoir des centaines de requêtes département/région en vol depuis un
+seul process, avec un pool de connexions keep-alive dimensionné explicitement.
+
+Le parsing HTML (BeautifulSoup, coûteux en CPU) et l'écriture CSV sont
+déportés dans un executor pour ne pas bloquer la boucle asyncio.
+
+Dépendance optionnelle : aiohttp (pip install aiohttp)
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+
+class AsyncScanSanteClient:
+    def __init__(self, automation, concurrency=32, max_connections=100,
+                 max_connections_per_host=0, connect_timeout=10, read_timeout=60,
+                 keepalive_timeout=30, delay=0, executor=None, parse_workers=2):
+        """
+        automation : instance de ScanSanteFinalAutomation (construction des
+                     paramètres, parsing et sauvegarde)
+        concurrency : nombre maximum de requêtes /submit en vol (sémaphore)
+        max_connections : taille totale du pool de connexions TCP
+        max_connections_per_host : limite par hôte (0 = pas de limite)
+        connect_timeout / read_timeout : timeouts séparés en secondes
+        keepalive_timeout : durée de conservation des connexions inactives
+        delay : pause (secondes) après chaque requête, par créneau de concurrence
+        executor : executor pour le parsing (par défaut un petit pool de threads)
+        """
+        self.automation = automation
+        self.concurrency = concurrency
+        self.max_connections = max_connections
+        self.max_connections_per_host = max_connections_per_host
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.keepalive_timeout = keepalive_timeout
+        self.delay = delay
+        self.executor = executor
+        self.parse_workers = parse_workers
+        self.logger = automation.logger
+
+    def _create_session(self, aiohttp):
+        connector = aiohttp.TCPConnector(
+            limit=self.max_connections,
+            limit_per_host=self.max_connections_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            ttl_dns_cache=300
+        )
+        timeout = aiohttp.ClientTimeout(
+            total=None,
+            sock_connect=self.connect_timeout,
+            sock_read=self.read_timeout
+        )
+        return aiohttp.ClientSession(
+            connector=connector,
+            timeout=timeout,
+            headers=self.automation.http_headers
+        )
+
+    async def _open_main_page(self, session):
+        """Visite la page principale une fois pour établir les cookies de session"""
+        import aiohttp
+
+        base_url = self.automation.base_url
+        try:
+            async with session.get(base_url + self.automation.main_path) as response:
+                await response.read()
+                if response.status != 200:
+                    self.logger.error(f"Erreur page principale: {response.status}")
+                    return False
+        except (asyncio.TimeoutError, aiohttp.ClientError, OSError) as e:
+            self.logger.error(f"Erreur réseau sur la page principale: {e!r}")
+            return False
+        return True
+
+    async def download(self, session, semaphore, params):
+        """GET /submit pour une combinaison ; contenu HTML ou None en cas d'erreur
+
+        Les erreurs réseau (timeout, connexion fermée par le serveur, réponse
+        tronquée...) ne concernent que cette combinaison : elles ne remontent
+        pas dans asyncio.gather.
+        """
+        import aiohttp
+
+        automation = self.automation
+        url = automation.base_url + automation.submit_url
+
+        async with semaphore:
+            try:
+                async with session.get(url, params=automation.build_submit_params(params)) as response:
+                    content = await response.read()
+                    if response.status != 200:
+                        self.logger.error(f"Erreur submit: {response.status}")
+                        return None
+                    return content
+            except (asyncio.TimeoutError, aiohttp.ClientError, OSError) as e:
+                self.logger.error(f"Erreur réseau lors du scraping: {e!r}")
+                return None
+            finally:
+                if self.delay:
+                    await asyncio.sleep(self.delay)
+
+    async def fetch(self, session, semaphore, params):
+        """Télécharge et traite une combinaison ; retourne le même statut que scrape_table_data
+
+        Un tableau qui ne se rapproche pas de sa ligne Total est retéléchargé
+        aussitôt (automation.reconcile_retries fois au plus).
+        """
+        automation = self.automation
+        loop = asyncio.get_running_loop()
+
+        for attempt in range(automation.reconcile_retries + 1):
+            content = await self.download(session, semaphore, params)
+            if content is None:
+                return False
+
+            retry = attempt < automation.reconcile_retries
+            try:
+                result = await loop.run_in_executor(self.executor, automation.process_response,
+                                                    params, content, retry)
+            except Exception as e:
+                self.logger.error(f"Erreur lors du scraping: {e}")
+                return False
+            if result != "mismatch" or not retry:
+                return result
+            self.logger.info(f"Nouvelle tentative immédiate ({attempt + 1}/{automation.reconcile_retries})")
+
+    async def _with_session(self, work):
+        """Ouvre la session (pool, executor, page principale) et exécute work(session, semaphore)
+
+        Retourne None si la page principale est inaccessible.
+        """
+        try:
+            import aiohttp
+        except ImportError:
+            raise ImportError("Le client asynchrone nécessite aiohttp : pip install aiohttp")
+
+        own_executor = self.executor is None
+        if own_executor:
+            self.executor = ThreadPoolExecutor(max_workers=self.parse_workers,
+                                               thread_name_prefix='scansante-parse')
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        try:
+            async with self._create_session(aiohttp) as session:
+                if not await self._open_main_page(session):
+                    return None
+                return await work(session, semaphore)
+        finally:
+            if own_executor:
+                self.executor.shutdown(wait=True)
+                self.executor = None
+
+    async def scrape_all(self, combinations):
+        """Scrape toutes les combinaisons ; résultats dans l'ordre d'entrée"""
+        async def work(session, semaphore):
+            tasks = [self.fetch(session, semaphore, params) for params in combinations]
+            return await asyncio.gather(*tasks)
+
+        results = await self._with_session(work)
+        return [False] * len(combinations) if results is None else results
+
+    async def scrape_scheduled(self, scheduler):
+        """Traite les combinaisons d'un scheduler.PriorityScheduler
+
+        concurrency workers tirent tour à tour la prochaine combinaison : l'ordre
+        de priorité, le budget et les nouvelles tentatives sont respectés.
+        File vide : un worker attend la fin des requêtes en vol (qui peuvent
+        remettre une combinaison en file) et ne s'arrête que si plus rien n'est
+        en vol ou si le budget est épuisé.
+        Retourne la liste des (params, résultat) dans l'ordre de fin de traitement.
+        """
+        results = []
+        in_flight = 0
+
+        async def worker(session, semaphore, finished):
+            nonlocal in_flight
+            while True:
+                params = scheduler.next()
+                if params is None:
+                    if in_flight == 0 or scheduler.stop_reason:
+                        return
+                    async with finished:
+                        await finished.wait()
+                    continue
+
+                in_flight += 1
+                try:
+                    result = await self.fetch(session, semaphore, params)
+                    scheduler.record(params, result)
+                    results.append((params, result))
+                finally:
+                    in_flight -= 1
+                    async with finished:
+                        finished.notify_all()
+
+        async def work(session, semaphore):
+            finished = asyncio.Condition()
+            await asyncio.gather(*(worker(session, semaphore, finished) for _ in range(self.concurrency)))
+            return results
+
+        return await self._with_session(work) or []
+
+    def run(self, combinations):
+        """Point d'entrée synchrone"""
+        return asyncio.run(self.scrape_all(list(combinations)))
+
+    def run_scheduled(self, scheduler):
+        """Point d'entrée synchrone pour un PriorityScheduler"""
+        return asyncio.run(self.scrape_scheduled(scheduler))
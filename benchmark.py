@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmarks ScrapingScanSante
+Mesures locales (sans réseau) sur les CSV déjà scrapés dans donnees_scansante
+
+Usage : python benchmark.py [memoire] [demarrage] [nettoyage] [chargement] [instantane]
+"""
+
+import glob
+import os
+import sys
+import time
+
+
+def deep_sizeof_rows(rows):
+    """Taille mémoire d'une liste de listes de chaînes Python (octets)"""
+    total = sys.getsizeof(rows)
+    for row in rows:
+        total += sys.getsizeof(row)
+        total += sum(sys.getsizeof(cell) for cell in row)
+    return total
+
+
+def bench_memory(data_dir="donnees_scansante"):
+    """Mémoire par 1 000 établissements : listes Python / DataFrame object / CompactTable"""
+    import csv
+    import pandas as pd
+    from compact_table import CompactTable
+
+    files = glob.glob(os.path.join(data_dir, '**', '*.csv'), recursive=True)
+    if not files:
+        print(f"Aucun CSV trouvé dans {data_dir}")
+        return
+
+    n_rows = rows_bytes = frame_bytes = compact_bytes = 0
+    parse_time = 0.0
+    for path in files:
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            reader = csv.reader(f)
+            headers = next(reader)
+            rows = list(reader)
+
+        start = time.perf_counter()
+        table = CompactTable.from_rows(headers, rows)
+        parse_time += time.perf_counter() - start
+
+        n_rows += len(rows)
+        rows_bytes += deep_sizeof_rows(rows)
+        frame_bytes += int(pd.DataFrame(rows, columns=headers).memory_usage(deep=True).sum())
+        compact_bytes += table.nbytes
+
+    per_1000 = 1000 / n_rows
+    print(f"=== Mémoire ({len(files)} fichiers, {n_rows:,} lignes) ===")
+    print(f"Listes de chaînes      : {rows_bytes * per_1000 / 1024:8.1f} Ko / 1 000 établissements")
+    print(f"DataFrame pandas       : {frame_bytes * per_1000 / 1024:8.1f} Ko / 1 000 établissements")
+    print(f"CompactTable           : {compact_bytes * per_1000 / 1024:8.1f} Ko / 1 000 établissements")
+    print(f"Parsing CompactTable   : {parse_time * 1000 * per_1000:8.2f} ms / 1 000 établissements")
+
+
+def bench_fused(data_dir="donnees_scansante"):
+    """Pipeline historique (brut -> nettoyé -> consolidé, 3 passes disque) vs mode fusionné (1 passe)"""
+    import csv
+    import logging
+    import tempfile
+    import data_cleaner
+    from compact_table import CompactTable
+    from final_automation import ScanSanteFinalAutomation
+
+    files = sorted(glob.glob(os.path.join(data_dir, '**', '*.csv'), recursive=True))
+    if not files:
+        print(f"Aucun CSV trouvé dans {data_dir}")
+        return
+
+    # Lignes "scrapées" en mémoire, comme en sortie de parse_table_html
+    scraped = []
+    for path in files:
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            reader = csv.reader(f)
+            scraped.append((os.path.relpath(path, data_dir), next(reader), list(reader)))
+
+    logging.disable(logging.INFO)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            raw_dir, cleaned_dir = os.path.join(tmp, 'brut'), os.path.join(tmp, 'nettoye')
+            os.makedirs(raw_dir)
+            os.makedirs(cleaned_dir)
+
+            start = time.perf_counter()
+            for i, (_, headers, rows) in enumerate(scraped):
+                raw_path = os.path.join(raw_dir, f"{i}.csv")
+                CompactTable.from_rows(headers, rows).write_csv(raw_path)
+                data_cleaner.clean_csv_file(raw_path, os.path.join(cleaned_dir, f"cleaned_{i}.csv"))
+            data_cleaner.create_consolidated_file(cleaned_dir, os.path.join(tmp, 'master.csv'))
+            classic = time.perf_counter() - start
+
+            automation = ScanSanteFinalAutomation(output_dir=os.path.join(tmp, 'fusion'), fused='raw+clean',
+                                                  consolidated_file=os.path.join(tmp, 'master_fusion.csv'))
+            start = time.perf_counter()
+            for relative_path, headers, rows in scraped:
+                raw_path = os.path.join(automation.output_dir, relative_path)
+                os.makedirs(os.path.dirname(raw_path), exist_ok=True)
+                CompactTable.from_rows(headers, rows).write_csv(raw_path)
+                automation.write_cleaned_outputs(relative_path, headers, rows)
+            fused = time.perf_counter() - start
+    finally:
+        logging.disable(logging.NOTSET)
+
+    print(f"=== Nettoyage ({len(files)} combinaisons) ===")
+    print(f"Historique (3 passes)  : {classic:7.2f} s  ({classic / len(files) * 1000:.1f} ms / combinaison)")
+    print(f"Fusionné (1 passe)     : {fused:7.2f} s  ({fused / len(files) * 1000:.1f} ms / combinaison)")
+
+
+def bench_loading(data_dir="donnees_scansante", repeat=3):
+    """Chargement du corpus nettoyé : pd.read_csv sans types vs schema.read_corpus (types explicites)"""
+    import logging
+    import tempfile
+    import pandas as pd
+    import data_cleaner
+    import schema
+
+    files = sorted(glob.glob(os.path.join(data_dir, '**', '*.csv'), recursive=True))
+    if not files:
+        print(f"Aucun CSV trouvé dans {data_dir}")
+        return
+
+    logging.disable(logging.INFO)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            cleaned = []
+            for i, path in enumerate(files):
+                cleaned.append(os.path.join(tmp, f"cleaned_{i}_{os.path.basename(path)}"))
+                data_cleaner.clean_csv_file(path, cleaned[-1])
+
+            def inferred():
+                return pd.concat([pd.read_csv(path) for path in cleaned], ignore_index=True)
+
+            timings = {}
+            for label, load in [("pd.read_csv (inférence)", inferred),
+                                ("schema.read_corpus", lambda: schema.read_corpus(cleaned)),
+                                ("schema (Finess + séjours)",
+                                 lambda: schema.read_corpus(cleaned, columns=['finess', 'sejours_total']))]:
+                best = None
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    df = load()
+                    elapsed = time.perf_counter() - start
+                    best = elapsed if best is None else min(best, elapsed)
+                timings[label] = (best, df)
+    finally:
+        logging.disable(logging.NOTSET)
+
+    engine = 'pyarrow' if schema._has_pyarrow() else 'pandas C'
+    print(f"=== Chargement ({len(files)} fichiers nettoyés, moteur {engine}, meilleur de {repeat}) ===")
+    for label, (best, df) in timings.items():
+        print(f"{label:28s}: {best:6.2f} s  {len(df):,} lignes  {df.memory_usage(deep=True).sum() / 1e6:6.1f} Mo  "
+              f"Finess: {df['Finess'].dtype}")
+
+
+def bench_snapshot(data_dir="donnees_scansante", repeat=5):
+    """Chargement à froid du consolidé : CSV (pandas, schema) vs instantané binaire (mmap)"""
+    import logging
+    import tempfile
+    import pandas as pd
+    import data_cleaner
+    import schema
+
+    files = sorted(glob.glob(os.path.join(data_dir, '**', '*.csv'), recursive=True))
+    if not files:
+        print(f"Aucun CSV trouvé dans {data_dir}")
+        return
+
+    logging.disable(logging.INFO)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            for i, path in enumerate(files):
+                data_cleaner.clean_csv_file(path, os.path.join(tmp, f"cleaned_{i}_{os.path.basename(path)}"))
+            master = os.path.join(tmp, 'master.csv')
+            data_cleaner.create_consolidated_file(tmp, master)
+            snap = os.path.splitext(master)[0] + '.snap'
+
+            timings = []
+            for label, load in [("pd.read_csv", lambda: pd.read_csv(master)),
+                                ("schema.read_csv", lambda: schema.read_csv(master)),
+                                ("open_snapshot (mmap)", lambda: data_cleaner.open_snapshot(snap)),
+                                ("load_snapshot (DataFrame)", lambda: data_cleaner.load_snapshot(snap))]:
+                best = None
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    load()
+                    elapsed = time.perf_counter() - start
+                    best = elapsed if best is None else min(best, elapsed)
+                timings.append((label, best))
+            sizes = os.path.getsize(master), os.path.getsize(snap)
+    finally:
+        logging.disable(logging.NOTSET)
+
+    print(f"=== Instantané (CSV {sizes[0] / 1e6:.1f} Mo, instantané {sizes[1] / 1e6:.1f} Mo, meilleur de {repeat}) ===")
+    for label, best in timings:
+        print(f"{label:28s}: {best * 1000:8.1f} ms")
+
+
+STARTUP_SCENARIOS = [
+    ("import final_automation", "import final_automation"),
+    ("instance + combinaisons",
+     "from final_automation import ScanSanteFinalAutomation; "
+     "ScanSanteFinalAutomation().get_strategic_combinations()"),
+    ("import data_cleaner", "import data_cleaner"),
+    ("import app (Flask)", "import app"),
+]
+
+HEAVY_MODULES = ['pandas', 'numpy', 'bs4', 'requests']
+
+
+def bench_startup(repeat=5):
+    """Temps de démarrage d'un process Python neuf pour chaque scénario (meilleur de N)"""
+    import subprocess
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    check = "; import sys; print(','.join(m for m in %r if m in sys.modules))" % HEAVY_MODULES
+
+    baseline = min(_time_process([sys.executable, '-c', 'pass'], here) for _ in range(repeat))
+    print(f"=== Démarrage (meilleur de {repeat}, interpréteur nu: {baseline * 1000:.0f} ms) ===")
+
+    for label, code in STARTUP_SCENARIOS:
+        try:
+            best = min(_time_process([sys.executable, '-c', code], here) for _ in range(repeat))
+        except subprocess.CalledProcessError:
+            print(f"{label:28s}: échec (dépendance manquante ?)")
+            continue
+        loaded = subprocess.run([sys.executable, '-c', code + check], cwd=here,
+                                capture_output=True, text=True).stdout.strip().splitlines()
+        heavy = loaded[-1] if loaded else ''
+        print(f"{label:28s}: {best * 1000:7.0f} ms  (+{(best - baseline) * 1000:.0f} ms)  "
+              f"modules lourds chargés: {heavy or 'aucun'}")
+
+
+def _time_process(command, cwd):
+    import subprocess
+
+    start = time.perf_counter()
+    subprocess.run(command, cwd=cwd, check=True, capture_output=True)
+    return time.perf_counter() - start
+
+
+BENCHMARKS = {
+    'memoire': bench_memory,
+    'demarrage': bench_startup,
+    'nettoyage': bench_fused,
+    'chargement': bench_loading,
+    'instantane': bench_snapshot,
+}
+
+
+def main(names=None):
+    names = names or list(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS:
+            print(f"Benchmark inconnu: {name} (disponibles: {', '.join(BENCHMARKS)})")
+            continue
+        BENCHMARKS[name]()
+        print()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,409 @@
+# -*- coding: utf-8 -*-
+"""
+Représentation compacte en mémoire d'un tableau ScanSante
+Parse les lignes scrapées directement en colonnes NumPy typées au lieu de
+listes de chaînes Python :
+
+- Catégorie / Période : codes de catégorie (int16) + dictionnaire
+- Finess : octets de largeur fixe (S9)
+- Nombres de séjours/séances : int32 ("1 à 10" et valeurs manquantes en sentinelles)
+- Ratios (sexe ratio, âge moyen, DMS, % décès) : float32
+- Texte libre (Raison Sociale) : un seul tampon UTF-8 + offsets int32
+
+Le texte brut est reconstructible à l'identique (write_csv) et la ligne
+Total est conservée à part (total).
+"""
+
+import csv
+import hashlib
+import io
+import sys
+
+import numpy as np
+
+# Sentinelles des colonnes de comptage
+SMALL_COUNT = -1      # "1 à 10" (secret statistique)
+MISSING_COUNT = -2    # valeur absente ou non numérique (voir exceptions)
+SMALL_COUNT_TEXT = "1 à 10"
+SMALL_COUNT_VALUE = 5  # valeur retenue au nettoyage pour "1 à 10"
+
+FINESS_WIDTH = 9
+
+
+def column_kind(header):
+    """Détermine le type de stockage d'une colonne à partir de son en-tête"""
+    name = header.strip().lower()
+    if name == 'finess':
+        return 'finess'
+    if name in ('catégorie', 'categorie', 'période', 'periode'):
+        return 'category'
+    if name.startswith('nombre'):
+        return 'count'
+    if name.startswith(('sexe ratio', 'age moyen', 'âge moyen', 'durée moyenne', '% décès')):
+        return 'ratio'
+    return 'text'
+
+
+def parse_count(text):
+    """Convertit "9 337" en 9337 ; None si non numérique"""
+    digits = text.replace(' ', '').replace(' ', '').replace(' ', '')
+    if digits.isdigit():
+        return int(digits)
+    return None
+
+
+def parse_ratio(text):
+    """Convertit "59,6 %" / "62,42" en (valeur, décimales, pourcentage) ; None si non numérique"""
+    value = text.replace(' ', ' ').strip()
+    percent = value.endswith('%')
+    if percent:
+        value = value[:-1].strip()
+    value = value.replace(' ', '').replace(',', '.')
+    try:
+        number = float(value)
+    except ValueError:
+        return None
+    decimals = len(value.split('.', 1)[1]) if '.' in value else 0
+    return number, decimals, percent
+
+
+class CompactColumn:
+    """Une colonne typée : tableau NumPy + exceptions textuelles éparses"""
+
+    def __init__(self, header, kind, values, categories=None, decimals=0, percent=False, exceptions=None,
+                 buffer=None):
+        self.header = header
+        self.kind = kind
+        # Pour le texte libre : offsets dans buffer (n + 1 valeurs)
+        self.values = values
+        self.buffer = buffer
+        self.categories = categories
+        self.decimals = decimals
+        self.percent = percent
+        # Valeurs non typables conservées telles quelles {index_ligne: texte}
+        self.exceptions = exceptions or {}
+
+    @property
+    def nbytes(self):
+        total = self.values.nbytes
+        if self.buffer is not None:
+            total += len(self.buffer)
+        if self.categories:
+            total += sum(sys.getsizeof(c) for c in self.categories)
+        total += sum(sys.getsizeof(v) for v in self.exceptions.values())
+        return total
+
+    def format_value(self, i):
+        """Texte brut de la cellule i, identique à celui du HTML scrapé"""
+        if i in self.exceptions:
+            return self.exceptions[i]
+
+        value = self.values[i]
+        if self.kind == 'category':
+            return self.categories[value]
+        if self.kind == 'finess':
+            return value.decode('ascii')
+        if self.kind == 'count':
+            if value == SMALL_COUNT:
+                return SMALL_COUNT_TEXT
+            return f"{int(value):,}".replace(',', ' ')
+        if self.kind == 'ratio':
+            text = f"{float(value):.{self.decimals}f}".replace('.', ',')
+            return text + ' %' if self.percent else text
+        return self.buffer[self.values[i]:self.values[i + 1]].decode('utf-8')
+
+    def cleaned_values(self):
+        """Valeurs nettoyées : comptages en int ("1 à 10" -> 5, manquant -> 0)"""
+        if self.kind == 'count':
+            values = self.values.copy()
+            values[values == SMALL_COUNT] = SMALL_COUNT_VALUE
+            values[values == MISSING_COUNT] = 0
+            return values
+        if self.kind == 'ratio':
+            return self.values
+        if self.kind == 'finess':
+            return np.char.zfill(self.values.astype(str), FINESS_WIDTH)
+        return None
+
+
+class CompactTable:
+    """Tableau ScanSante stocké par colonnes typées"""
+
+    def __init__(self, headers, columns, n_rows, total=None):
+        self.headers = list(headers)
+        self.columns = columns
+        self.n_rows = n_rows
+        # Ligne Total brute (liste de chaînes) ou None
+        self.total = total
+
+    def __len__(self):
+        return self.n_rows
+
+    @classmethod
+    def from_rows(cls, headers, rows):
+        """Construit le tableau à partir des lignes brutes (listes de chaînes)"""
+        rows = list(rows)
+        total = None
+        if rows and is_total_row(headers, rows[-1]):
+            total = list(rows[-1])
+            rows = rows[:-1]
+
+        n_rows = len(rows)
+        columns = []
+        for j, header in enumerate(headers):
+            cells = [row[j] if j < len(row) else '' for row in rows]
+            columns.append(_build_column(header, column_kind(header), cells))
+
+        return cls(headers, columns, n_rows, total)
+
+    @classmethod
+    def read_csv(cls, path, encoding='utf-8-sig'):
+        """Lit un CSV brut écrit par le scraper"""
+        with open(path, newline='', encoding=encoding) as f:
+            reader = csv.reader(f)
+            headers = next(reader)
+            return cls.from_rows(headers, reader)
+
+    @property
+    def nbytes(self):
+        """Empreinte mémoire approximative des colonnes (octets)"""
+        return sum(column.nbytes for column in self.columns)
+
+    def column(self, header):
+        for column in self.columns:
+            if column.header == header:
+                return column
+        raise KeyError(header)
+
+    def columns_of_kind(self, kind):
+        return [column for column in self.columns if column.kind == kind]
+
+    def take(self, indices, total=None):
+        """Sous-tableau des lignes indices (ordre conservé), avec une ligne Total optionnelle"""
+        indices = np.asarray(indices, dtype=np.int64)
+        position = {int(old): new for new, old in enumerate(indices)}
+        columns = []
+        for column in self.columns:
+            exceptions = {position[i]: text for i, text in column.exceptions.items() if i in position}
+            if column.kind == 'text':
+                pieces = [column.buffer[column.values[i]:column.values[i + 1]] for i in indices]
+                offsets = np.zeros(len(pieces) + 1, dtype=np.int32)
+                np.cumsum([len(p) for p in pieces], out=offsets[1:])
+                columns.append(CompactColumn(column.header, column.kind, offsets, buffer=b''.join(pieces)))
+            else:
+                columns.append(CompactColumn(column.header, column.kind, column.values[indices],
+                                             categories=column.categories, decimals=column.decimals,
+                                             percent=column.percent, exceptions=exceptions))
+        return CompactTable(self.headers, columns, len(indices), total)
+
+    def stay_weights(self):
+        """Pondération des ratios : séjours/séances total + séances
+
+        C'est la pondération qui reproduit les ratios de la ligne Total publiée
+        par ScanSante ("1 à 10" compté 5, d'où un écart de l'ordre de l'arrondi).
+        """
+        counts = self.columns_of_kind('count')
+        if not counts:
+            return None
+        total = next((c for c in counts if 'total' in c.header.lower()), counts[0])
+        sessions = next((c for c in counts if c.header.lower().strip() == 'nombre de séances'), None)
+        weights = total.cleaned_values().astype(np.float64)
+        if sessions is not None and sessions is not total:
+            weights += sessions.cleaned_values()
+        return weights
+
+    def weighted_ratios(self, indices=None):
+        """Ratios pondérés (comme la ligne Total) : {en-tête: valeur ou NaN}"""
+        weights = self.stay_weights()
+        result = {}
+        for column in self.columns_of_kind('ratio'):
+            values = column.values.astype(np.float64)
+            w = weights if weights is not None else np.ones_like(values)
+            if indices is not None:
+                values, w = values[indices], w[indices]
+            valid = ~np.isnan(values) & (w > 0)
+            denominator = w[valid].sum()
+            result[column.header] = float((values[valid] * w[valid]).sum() / denominator) if denominator else np.nan
+        return result
+
+    def total_row(self, indices=None):
+        """Ligne Total recalculée au format ScanSante (comptages sommés ou NA, ratios pondérés)"""
+        ratios = self.weighted_ratios(indices)
+        row = []
+        for column in self.columns:
+            if column.kind == 'text':
+                row.append('Total')
+            elif column.kind == 'count':
+                # Somme exacte seulement sans valeur masquée ("1 à 10") ni manquante
+                values = column.values if indices is None else column.values[indices]
+                if len(values) and (values >= 0).all():
+                    row.append(f"{int(values.sum(dtype=np.int64)):,}".replace(',', ' '))
+                else:
+                    row.append('NA')
+            elif column.kind == 'ratio' and not np.isnan(ratios[column.header]):
+                text = f"{ratios[column.header]:.{column.decimals}f}".replace('.', ',')
+                row.append(text + ' %' if column.percent else text)
+            else:
+                row.append('')
+        return row
+
+    def reconcile(self, count_tolerance=0.003, ratio_tolerance=1.0):
+        """Compare les colonnes à la ligne Total publiée (détection des réponses tronquées)
+
+        Comptages : le Total publié doit tomber dans [somme avec "1 à 10" = 1,
+        somme avec "1 à 10" = 10], élargi de count_tolerance (les totaux nationaux
+        publiés sont ~0,2 % sous la somme des lignes) ; les totaux "NA" sont ignorés.
+        Ratios : écart au ratio pondéré (stay_weights) d'au plus ratio_tolerance
+        unité de la dernière décimale publiée.
+        Retourne {'ok', 'checked', 'count_gap', 'ratio_gap', 'failures'}.
+        """
+        if self.total is None:
+            return {'ok': False, 'checked': 0, 'count_gap': None, 'ratio_gap': None,
+                    'failures': ['Total absent']}
+
+        ratios = self.weighted_ratios()
+        checked, failures = 0, []
+        count_gap = ratio_gap = 0.0
+        for column, cell in zip(self.columns, self.total):
+            if column.kind == 'count':
+                published = parse_count(cell)
+                if published is None:
+                    continue
+                values = column.values.astype(np.int64)
+                missing = values == MISSING_COUNT
+                small = values == SMALL_COUNT
+                values[missing | small] = 0
+                low = values.sum() + small.sum()
+                high = values.sum() + 10 * small.sum()
+                if published < low:
+                    gap = (low - published) / max(published, 1)
+                elif published > high:
+                    gap = (published - high) / max(high, 1)
+                else:
+                    gap = 0.0
+                count_gap = max(count_gap, gap)
+                failed = gap > count_tolerance
+            elif column.kind == 'ratio':
+                parsed = parse_ratio(cell)
+                computed = ratios.get(column.header, np.nan)
+                if parsed is None or np.isnan(computed):
+                    continue
+                published, decimals, _ = parsed
+                gap = abs(published - computed) * 10 ** decimals
+                ratio_gap = max(ratio_gap, gap)
+                failed = gap > ratio_tolerance
+            else:
+                continue
+            checked += 1
+            if failed:
+                failures.append(column.header)
+
+        return {'ok': not failures, 'checked': checked, 'count_gap': round(float(count_gap), 5),
+                'ratio_gap': round(float(ratio_gap), 3), 'failures': failures}
+
+    def iter_raw_rows(self, include_total=True):
+        """Génère les lignes au format texte d'origine"""
+        for i in range(self.n_rows):
+            yield [column.format_value(i) for column in self.columns]
+        if include_total and self.total is not None:
+            yield self.total
+
+    def write_csv(self, path, encoding='utf-8-sig'):
+        """Écrit le CSV brut (même format que l'export DataFrame historique)
+
+        Retourne l'empreinte SHA-256 du contenu écrit (manifeste du run).
+        """
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator='\n')
+        writer.writerow(self.headers)
+        writer.writerows(self.iter_raw_rows())
+        data = buffer.getvalue().encode(encoding)
+
+        with open(path, 'wb') as f:
+            f.write(data)
+        return hashlib.sha256(data).hexdigest()
+
+    def to_dataframe(self, cleaned=True, ratios_as_text=False):
+        """Convertit en DataFrame pandas (catégories en dtype category)
+
+        cleaned : comptages en int (règles de nettoyage) au lieu du texte brut
+        ratios_as_text : conserve les ratios au format texte d'origine
+        """
+        import pandas as pd
+
+        data = {}
+        for column in self.columns:
+            if column.kind == 'category':
+                data[column.header] = pd.Categorical.from_codes(column.values, categories=column.categories)
+            elif column.kind == 'text' or not cleaned or (column.kind == 'ratio' and ratios_as_text):
+                data[column.header] = [column.format_value(i) for i in range(self.n_rows)]
+            else:
+                data[column.header] = column.cleaned_values()
+        return pd.DataFrame(data, columns=self.headers)
+
+
+def is_total_row(headers, row):
+    """La ligne Total a une Raison Sociale "Total" et pas de Finess"""
+    return any(cell.strip() == 'Total' for cell in row) and not any(
+        column_kind(h) == 'finess' and j < len(row) and row[j].strip()
+        for j, h in enumerate(headers)
+    )
+
+
+def _build_column(header, kind, cells):
+    n = len(cells)
+    exceptions = {}
+
+    if kind == 'count':
+        values = np.empty(n, dtype=np.int32)
+        for i, cell in enumerate(cells):
+            if cell == SMALL_COUNT_TEXT:
+                values[i] = SMALL_COUNT
+                continue
+            number = parse_count(cell)
+            if number is None:
+                values[i] = MISSING_COUNT
+                exceptions[i] = cell
+            else:
+                values[i] = number
+        return CompactColumn(header, kind, values, exceptions=exceptions)
+
+    if kind == 'ratio':
+        values = np.empty(n, dtype=np.float32)
+        decimals, percent = None, False
+        for i, cell in enumerate(cells):
+            parsed = parse_ratio(cell)
+            if parsed is None:
+                values[i] = np.nan
+                exceptions[i] = cell
+                continue
+            values[i] = parsed[0]
+            if decimals is None:
+                decimals, percent = parsed[1], parsed[2]
+            elif (parsed[1], parsed[2]) != (decimals, percent):
+                # Format atypique : on garde le texte pour une restitution exacte
+                exceptions[i] = cell
+        return CompactColumn(header, kind, values, decimals=decimals or 0, percent=percent,
+                             exceptions=exceptions)
+
+    if kind == 'finess':
+        values = np.empty(n, dtype=f'S{FINESS_WIDTH}')
+        for i, cell in enumerate(cells):
+            if len(cell) <= FINESS_WIDTH and cell.isascii():
+                values[i] = cell.encode('ascii')
+            else:
+                values[i] = b''
+                exceptions[i] = cell
+        return CompactColumn(header, kind, values, exceptions=exceptions)
+
+    if kind == 'category':
+        lookup = {}
+        values = np.empty(n, dtype=np.int16)
+        for i, cell in enumerate(cells):
+            values[i] = lookup.setdefault(cell, len(lookup))
+        return CompactColumn(header, kind, values, categories=list(lookup))
+
+    encoded = [cell.encode('utf-8') for cell in cells]
+    offsets = np.zeros(n + 1, dtype=np.int32)
+    np.cumsum([len(e) for e in encoded], out=offsets[1:])
+    return CompactColumn(header, kind, offsets, buffer=b''.join(encoded))
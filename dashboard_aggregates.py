@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+"""
+Agrégats pré-calculés (vues matérialisées) pour les pages du tableau de bord
+
+Calculés une fois à la fin d'une consolidation à partir des tableaux France
+entière, puis stockés dans un petit fichier JSON (AGGREGATES_FILENAME) à côté
+du manifeste :
+
+- national : totaux par type de données, année et type d'établissement
+  (comptages sommés, ratios pondérés comme la ligne Total) ;
+- public_prive : répartition des séjours publics / privés par année ;
+- par_categorie : séjours, DMS, âge moyen... par Catégorie d'établissement ;
+- evolution : variations d'une année sur l'autre (en %) des totaux nationaux.
+
+AggregateCache charge le fichier une fois dans le process Flask et ne le
+relit que s'il change (simple stat du fichier) : une page coûte le même temps
+quelle que soit la taille du jeu de données. Si le manifeste a changé depuis
+le calcul (collecte en cours...), les derniers agrégats restent servis et un
+seul thread de fond les recalcule, au plus une fois par minute.
+"""
+
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import schema
+
+logger = logging.getLogger(__name__)
+
+AGGREGATES_FILENAME = "dashboard_aggregates.json"
+MANIFEST_FILENAME = "manifest.jsonl"
+
+NATIONAL_FOLDER = "01_France_entiere"
+DRILL_FOLDER = "4_Regroupements_GHM"
+BASE_FOLDERS = {
+    'A_Publics_PSPH': 'bpub',
+    'B_Prives_OQN': 'bpri',
+    'C_Tous_etablissements': 'ball',
+}
+SECTIONS = ('national', 'public_prive', 'par_categorie', 'evolution')
+# Délai minimal (secondes) entre deux recalculs de fond : pendant une collecte, le manifeste change à chaque combinaison
+REBUILD_INTERVAL = 60
+
+# Préfixe cleaned_ : arbre nettoyé (mode fusionné 'clean', sans CSV brut)
+FILENAME_PATTERN = re.compile(r'^(?:cleaned_)?(\d{4})_(.+)\.csv$')
+
+
+def measure_key(header):
+    """Clé stable d'une colonne de mesure (registre schema : les en-têtes varient d'un export à l'autre)"""
+    field = schema.resolve(header)
+    if field is not None and field.kind in ('count', 'ratio'):
+        return field.key
+    return None
+
+
+def manifest_fingerprint(output_dir):
+    """Empreinte du manifeste (taille, date de modification) ; None s'il n'existe pas"""
+    try:
+        stat = os.stat(os.path.join(output_dir, MANIFEST_FILENAME))
+    except OSError:
+        return None
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def national_files(output_dir):
+    """Tableaux France entière de l'arbre : [(année, base, type de données, chemin)]
+
+    Sans tableau brut (mode fusionné 'clean'), les tableaux nettoyés sont lus.
+    """
+    from final_automation import cleaned_tree
+
+    return (_national_files(os.path.join(output_dir, NATIONAL_FOLDER))
+            or _national_files(os.path.join(cleaned_tree(output_dir), NATIONAL_FOLDER)))
+
+
+def _national_files(national_dir):
+    files = []
+    for folder, base in BASE_FOLDERS.items():
+        for root, dirs, names in os.walk(os.path.join(national_dir, folder)):
+            # Détail par DA / GP / racine / GHM (ghm_drilldown) : hors des agrégats nationaux
+            dirs[:] = [d for d in dirs if d != DRILL_FOLDER]
+            for name in sorted(names):
+                match = FILENAME_PATTERN.match(name)
+                if match:
+                    files.append((match.group(1), base, match.group(2), os.path.join(root, name)))
+    return sorted(files)
+
+
+def summarize(table, indices=None):
+    """Comptages sommés et ratios pondérés d'un tableau (ou d'un sous-ensemble de lignes)"""
+    summary = {'etablissements': int(len(table) if indices is None else len(indices))}
+    for column in table.columns_of_kind('count'):
+        key = measure_key(column.header)
+        if key:
+            values = column.cleaned_values()
+            summary[key] = int(values.sum() if indices is None else values[indices].sum())
+    for header, value in table.weighted_ratios(indices).items():
+        key = measure_key(header)
+        if key:
+            summary[key] = None if value != value else round(value, 2)
+    return summary
+
+
+def by_category(table):
+    """Résumé par Catégorie d'établissement (CH, CHU, CLCC...)"""
+    import numpy as np
+
+    header = next((h for h in table.headers if getattr(schema.resolve(h), 'key', None) == 'categorie'), None)
+    column = table.column(header) if header else None
+    if column is None or column.kind != 'category':
+        return {}
+    return {
+        name: summarize(table, np.flatnonzero(column.values == code))
+        for code, name in enumerate(column.categories)
+        if name and (column.values == code).any()
+    }
+
+
+def year_over_year(national):
+    """Variation (en %) de chaque comptage par rapport à l'année précédente disponible"""
+    evolution = {}
+    for data_type, years in national.items():
+        for base in sorted({base for by_base in years.values() for base in by_base}):
+            previous = None
+            for year in sorted(years):
+                current = years[year].get(base)
+                if current is None:
+                    continue
+                if previous is not None:
+                    deltas = {
+                        key: round((value - previous[key]) / previous[key] * 100, 2)
+                        for key, value in current.items()
+                        if isinstance(value, int) and key != 'etablissements' and previous.get(key)
+                    }
+                    evolution.setdefault(data_type, {}).setdefault(base, {})[year] = deltas
+                previous = current
+    return evolution
+
+
+def compute_aggregates(output_dir):
+    """Calcule toutes les sections à partir des tableaux France entière de output_dir"""
+    from compact_table import CompactTable
+
+    national, par_categorie = {}, {}
+    files = national_files(output_dir)
+    for year, base, data_type, path in files:
+        try:
+            table = CompactTable.read_csv(path)
+        except Exception as e:
+            logger.error(f"Agrégats: lecture impossible de {path}: {e}")
+            continue
+        national.setdefault(data_type, {}).setdefault(year, {})[base] = summarize(table)
+        if data_type == 'tous_sejours':
+            par_categorie.setdefault(year, {})[base] = by_category(table)
+
+    public_prive = {}
+    for year, by_base in sorted(national.get('tous_sejours', {}).items()):
+        public = by_base.get('bpub', {}).get('sejours_total')
+        private = by_base.get('bpri', {}).get('sejours_total')
+        if public is None or private is None:
+            continue
+        public_prive[year] = {
+            'public': public,
+            'prive': private,
+            'part_publique': round(public / (public + private) * 100, 2) if public + private else None
+        }
+
+    return {
+        'fingerprint': manifest_fingerprint(output_dir),
+        'generated_at': datetime.now().isoformat(timespec='seconds'),
+        'sources': len(files),
+        'national': national,
+        'public_prive': public_prive,
+        'par_categorie': par_categorie,
+        'evolution': year_over_year(national),
+    }
+
+
+def build_aggregates(output_dir, aggregates_file=None):
+    """Calcule et écrit le fichier d'agrégats (écriture atomique) ; retourne les agrégats"""
+    aggregates_file = aggregates_file or os.path.join(output_dir, AGGREGATES_FILENAME)
+    aggregates = compute_aggregates(output_dir)
+
+    directory = os.path.dirname(os.path.abspath(aggregates_file))
+    os.makedirs(directory, exist_ok=True)
+    # Fichier temporaire unique : plusieurs workers WSGI peuvent recalculer en même temps
+    fd, tmp = tempfile.mkstemp(prefix='.aggregates_', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(aggregates, f, ensure_ascii=False, separators=(',', ':'), sort_keys=True)
+        os.replace(tmp, aggregates_file)
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+    logger.info(f"Agrégats du tableau de bord écrits: {aggregates_file} ({aggregates['sources']} tableaux)")
+    return aggregates
+
+
+class AggregateCache:
+    """Agrégats chargés une fois en mémoire, réponses JSON pré-sérialisées par section
+
+    Une requête ne calcule jamais les agrégats : elle sert les derniers chargés
+    (sections vides tant qu'aucun calcul n'a abouti) ; le recalcul est fait par
+    la consolidation (build_aggregates) ou par un thread de fond.
+    """
+
+    def __init__(self, output_dir="donnees_scansante", aggregates_file=None, rebuild_interval=REBUILD_INTERVAL):
+        self.output_dir = output_dir
+        self.aggregates_file = aggregates_file or os.path.join(output_dir, AGGREGATES_FILENAME)
+        self.rebuild_interval = rebuild_interval
+        self._lock = threading.Lock()
+        self._fingerprint = None
+        self._file_mtime = None
+        self._bodies = {}
+        self._rebuilding = False
+        self._last_rebuild = None
+
+    def _file_state(self):
+        try:
+            return os.stat(self.aggregates_file).st_mtime_ns
+        except OSError:
+            return None
+
+    def _load(self, aggregates, file_mtime):
+        self._bodies = {
+            section: json.dumps(aggregates.get(section, {}), ensure_ascii=False, separators=(',', ':'))
+            for section in SECTIONS
+        }
+        self._bodies[None] = json.dumps(aggregates, ensure_ascii=False, separators=(',', ':'))
+        self._fingerprint = aggregates.get('fingerprint')
+        self._file_mtime = file_mtime
+
+    def refresh(self):
+        """Relit le fichier d'agrégats s'il a changé ; recalcul de fond s'il est absent ou périmé"""
+        file_mtime = self._file_state()
+        if not self._bodies or file_mtime != self._file_mtime:
+            with self._lock:
+                if not self._bodies or file_mtime != self._file_mtime:
+                    aggregates = {}
+                    if file_mtime is not None:
+                        try:
+                            with open(self.aggregates_file, encoding='utf-8') as f:
+                                aggregates = json.load(f)
+                        except (OSError, ValueError) as e:
+                            logger.error(f"Agrégats: lecture impossible de {self.aggregates_file}: {e}")
+                    if aggregates or not self._bodies:
+                        self._load(aggregates, file_mtime)
+                    else:
+                        self._file_mtime = file_mtime
+
+        if file_mtime is None or manifest_fingerprint(self.output_dir) != self._fingerprint:
+            self._schedule_rebuild()
+
+    def _schedule_rebuild(self):
+        """Lance un recalcul en thread de fond (un seul à la fois, au plus un par rebuild_interval)"""
+        with self._lock:
+            now = time.monotonic()
+            if self._rebuilding or (self._last_rebuild is not None
+                                    and now - self._last_rebuild < self.rebuild_interval):
+                return
+            self._rebuilding = True
+            self._last_rebuild = now
+        logger.info("Agrégats absents ou périmés (manifeste modifié) - recalcul en arrière-plan")
+        threading.Thread(target=self._rebuild, name='aggregates-rebuild', daemon=True).start()
+
+    def _rebuild(self):
+        try:
+            aggregates = build_aggregates(self.output_dir, self.aggregates_file)
+            with self._lock:
+                self._load(aggregates, self._file_state())
+        except Exception as e:
+            logger.error(f"Erreur lors du recalcul des agrégats: {e}")
+        finally:
+            self._rebuilding = False
+
+    def get_json(self, section=None):
+        """Corps JSON d'une section (ou de tous les agrégats) ; None si section inconnue"""
+        self.refresh()
+        return self._bodies.get(section)
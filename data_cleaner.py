@@ -5,21 +5,30 @@ Script de nettoyage des données ScrapingScanSante
 Traite tous les fichiers CSV avec la structure standard
 """
 
-import pandas as pd
 import os
 import glob
 import logging
 from pathlib import Path
 
-# Configuration logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('data_cleaning.log'),
-        logging.StreamHandler()
-    ]
-)
+def setup_logging():
+    """Configuration logging (exécution en script ; en import, le logging de l'appelant s'applique)"""
+    from queue_logging import start_queue_logging
+    start_queue_logging('data_cleaning.log')
+
+def clean_table(table):
+    """
+    Applique les règles de nettoyage à un CompactTable (voir clean_csv_file).
+    La ligne Total est déjà isolée par le tableau compact.
+    Retourne (DataFrame nettoyé, nombre de valeurs "1 à 10" remplacées)
+    """
+    from compact_table import SMALL_COUNT
+
+    replacements_made = sum(
+        int((column.values == SMALL_COUNT).sum()) for column in table.columns_of_kind('count')
+    )
+    # Comptages en int ("1 à 10" -> 5), Finess sur 9 caractères, ratios au format d'origine
+    df = table.to_dataframe(cleaned=True, ratios_as_text=True)
+    return df, replacements_made
 
 def clean_csv_file(input_file, output_file):
     """
@@ -28,41 +37,27 @@ def clean_csv_file(input_file, output_file):
     2. Convert Finess en texte
     3. Remplace "1 à 10" par "5" et convertit en entier
     """
+    from compact_table import CompactTable
+
     try:
-        # Lecture du fichier
-        df = pd.read_csv(input_file)
-        logging.info(f"Traitement de {input_file} - {len(df)} lignes")
-
-        # 1. Supprimer la dernière ligne (total)
-        df = df.iloc[:-1]
-        logging.info(f"Dernière ligne supprimée - {len(df)} lignes restantes")
-
-        # 2. Finess en texte (avec zéros de tête préservés)
-        if 'Finess' in df.columns:
-            df['Finess'] = df['Finess'].astype(str)
-            # Assurer 9 chiffres pour Finess (format standard)
-            df['Finess'] = df['Finess'].str.zfill(9)
-            logging.info("Colonne Finess convertie en texte")
-
-        # 3. Remplacer "1 à 10" par "5" dans toutes les colonnes numériques
-        columns_to_convert = [
-            'Nombre de séjours/séances total',
-            'Nombre de séjours en hospit complète',
-            'Nombre de séjours en hospit partielle',
-            'Nombre de séances'
-        ]
-
-        replacements_made = 0
-        for col in columns_to_convert:
-            if col in df.columns:
-                # Remplacer "1 à 10" par "5"
-                mask = df[col] == "1 à 10"
-                replacements_made += mask.sum()
-                df.loc[mask, col] = "5"
-
-                # Convertir en entier (gérer les NaN)
-                df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).astype(int)
+        # Lecture du fichier directement en colonnes typées
+        table = CompactTable.read_csv(input_file)
+        logging.info(f"Traitement de {input_file} - {len(table) + (table.total is not None)} lignes")
+
+        # 1. La ligne Total est isolée à la lecture
+        if table.total is not None:
+            logging.info(f"Dernière ligne supprimée - {len(table)} lignes restantes")
+            # Avant de l'écarter, vérifier que les colonnes se rapprochent de la ligne Total
+            reconciliation = table.reconcile()
+            if not reconciliation['ok']:
+                logging.warning(f"Écart à la ligne Total dans {input_file} "
+                                f"({', '.join(reconciliation['failures'])}) - fichier possiblement tronqué")
+        else:
+            logging.warning(f"Pas de ligne Total détectée dans {input_file}")
 
+        # 2. et 3. Finess en texte, "1 à 10" -> 5 et conversion en entier
+        df, replacements_made = clean_table(table)
+        logging.info("Colonne Finess convertie en texte")
         logging.info(f"{replacements_made} valeurs '1 à 10' remplacées par '5'")
 
         # Sauvegarde
@@ -77,14 +72,17 @@ def clean_csv_file(input_file, output_file):
 
 def clean_all_csv_files(input_dir="csv_files", output_dir="csv_files_cleaned"):
     """
-    Nettoie tous les fichiers CSV du dossier d'entrée
+    Nettoie tous les fichiers CSV du dossier d'entrée et de ses sous-dossiers
+    Arborescence miroir dans output_dir, noms préfixés cleaned_ (comme le mode fusionné)
     """
     # Créer le dossier de sortie
-    Path(output_dir).mkdir(exist_ok=True)
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
 
-    # Trouver tous les fichiers CSV
-    csv_pattern = os.path.join(input_dir, "*.csv")
-    csv_files = glob.glob(csv_pattern)
+    # Trouver tous les fichiers CSV (les fichiers bruts sont rangés par zone / établissement / type)
+    csv_pattern = os.path.join(input_dir, "**", "*.csv")
+    output_prefix = os.path.abspath(output_dir) + os.sep
+    csv_files = sorted(path for path in glob.glob(csv_pattern, recursive=True)
+                       if not os.path.abspath(path).startswith(output_prefix))
 
     if not csv_files:
         logging.warning(f"Aucun fichier CSV trouvé dans {input_dir}")
@@ -96,9 +94,11 @@ def clean_all_csv_files(input_dir="csv_files", output_dir="csv_files_cleaned"):
     total_rows = 0
 
     for csv_file in csv_files:
-        # Nom du fichier de sortie
-        filename = os.path.basename(csv_file)
-        output_file = os.path.join(output_dir, f"cleaned_{filename}")
+        # Nom du fichier de sortie, dans le même sous-dossier que le brut
+        relative_dir, filename = os.path.split(os.path.relpath(csv_file, input_dir))
+        target_dir = os.path.join(output_dir, relative_dir)
+        Path(target_dir).mkdir(parents=True, exist_ok=True)
+        output_file = os.path.join(target_dir, f"cleaned_{filename}")
 
         # Nettoyage
         success, rows = clean_csv_file(csv_file, output_file)
@@ -114,33 +114,227 @@ def clean_all_csv_files(input_dir="csv_files", output_dir="csv_files_cleaned"):
 def create_consolidated_file(input_dir="csv_files_cleaned", output_file="scansante_master_cleaned.csv"):
     """
     Consolide tous les fichiers nettoyés en un seul fichier pour Power BI
+
+    Lecture typée par le registre schema (en-têtes canoniques, Finess en texte,
+    comptages int32) via le moteur CSV de pyarrow s'il est installé.
+    Fichier_Source : chemin relatif du CSV brut (voir source_label).
     """
+    import schema
+
     try:
-        csv_pattern = os.path.join(input_dir, "cleaned_*.csv")
-        csv_files = glob.glob(csv_pattern)
+        csv_pattern = os.path.join(input_dir, "**", "cleaned_*.csv")
+        csv_files = sorted(glob.glob(csv_pattern, recursive=True))
 
         if not csv_files:
             logging.warning(f"Aucun fichier nettoyé trouvé dans {input_dir}")
             return
 
-        all_dataframes = []
-        for csv_file in csv_files:
-            df = pd.read_csv(csv_file)
-            # Ajouter une colonne source pour traçabilité
-            df['Fichier_Source'] = os.path.basename(csv_file)
-            all_dataframes.append(df)
-
-        # Consolidation
-        master_df = pd.concat(all_dataframes, ignore_index=True)
+        # Consolidation, avec une colonne source (Fichier_Source) pour traçabilité
+        master_df = schema.read_corpus(csv_files, sources=[source_label(path, input_dir) for path in csv_files])
         master_df.to_csv(output_file, index=False)
 
         logging.info(f"Fichier consolidé créé: {output_file}")
         logging.info(f"Total lignes consolidées: {len(master_df)}")
+        build_snapshot(output_file, master_df)
 
     except Exception as e:
         logging.error(f"Erreur lors de la consolidation: {str(e)}")
 
+def source_label(path, root):
+    """
+    Libellé Fichier_Source, le même pour les trois consolidations (nettoyés, fusion, mode fusionné) :
+    chemin du CSV brut relatif à son arbre, séparé par '/', sans le préfixe cleaned_
+    ('01_France_entiere/A_Publics_PSPH/1_Tous_sejours/2024_tous_sejours.csv')
+    """
+    relative_dir, filename = os.path.split(os.path.relpath(path, root))
+    if filename.startswith("cleaned_"):
+        filename = filename[len("cleaned_"):]
+    return os.path.join(relative_dir, filename).replace(os.sep, '/')
+
+def clean_rows(headers, rows):
+    """
+    Nettoie des lignes brutes au fil de l'eau, sans DataFrame (mêmes règles que clean_csv_file):
+    ligne Total ignorée, Finess sur 9 caractères, comptages "1 à 10" -> 5 et en entier
+    Lignes plus courtes que les en-têtes complétées par des cellules vides, lignes
+    vides ignorées (avertissement en fin de lecture)
+    """
+    from compact_table import column_kind, parse_count, FINESS_WIDTH, SMALL_COUNT_TEXT, SMALL_COUNT_VALUE
+
+    kinds = [column_kind(header) for header in headers]
+    finess_idx = kinds.index('finess') if 'finess' in kinds else None
+    count_idx = [j for j, kind in enumerate(kinds) if kind == 'count']
+
+    padded = skipped = 0
+    for row in rows:
+        row = list(row)
+        if len(row) < len(headers) and not any(cell.strip() for cell in row):
+            skipped += 1
+            continue
+
+        # Ligne Total : "Total" sans Finess
+        if 'Total' in row and (finess_idx is None or finess_idx >= len(row) or not row[finess_idx].strip()):
+            continue
+
+        if len(row) < len(headers):
+            padded += 1
+            row += [''] * (len(headers) - len(row))
+
+        if finess_idx is not None:
+            row[finess_idx] = row[finess_idx].zfill(FINESS_WIDTH)
+        for j in count_idx:
+            cell = row[j]
+            if cell == SMALL_COUNT_TEXT:
+                row[j] = SMALL_COUNT_VALUE
+            else:
+                row[j] = parse_count(cell) or 0
+        yield row
+
+    if padded or skipped:
+        logging.warning(f"Lignes incomplètes: {padded} complétées par des cellules vides, {skipped} vides ignorées")
+
+def write_rows(output_file, headers, rows):
+    """Écrit des lignes (nettoyées) en CSV, au même format que clean_csv_file ; retourne le nombre de lignes"""
+    import csv
+
+    count = 0
+    with open(output_file, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f, lineterminator='\n')
+        writer.writerow(headers)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    return count
+
+def clean_csv_rows(input_file, output_file):
+    """
+    Variante de clean_csv_file en flux (csv -> clean_rows -> csv), sans pandas ni NumPy
+    Retourne (succès, nombre de lignes)
+    """
+    import csv
+
+    try:
+        with open(input_file, newline='', encoding='utf-8-sig') as f:
+            reader = csv.reader(f)
+            headers = next(reader)
+            rows = write_rows(output_file, headers, clean_rows(headers, reader))
+        logging.info(f"Fichier nettoyé sauvegardé: {output_file} ({rows} lignes)")
+        return True, rows
+    except Exception as e:
+        logging.error(f"Erreur lors du traitement de {input_file}: {str(e)}")
+        return False, 0
+
+def stream_consolidate(sources, output_file, clean=True, with_snapshot=False):
+    """
+    Consolide des CSV en un seul fichier en une passe, ligne à ligne (mémoire constante)
+    sources : liste de (chemin, libellé Fichier_Source, voir source_label)
+    clean : applique clean_rows (fichiers bruts) ; False pour des fichiers déjà nettoyés
+    with_snapshot : construit l'instantané binaire pendant la même passe (SnapshotWriter)
+    En-têtes canoniques du registre schema, comme create_consolidated_file
+    Retourne le nombre de lignes écrites
+    """
+    import csv
+    import schema
+    import snapshot
+
+    total_rows = 0
+    out_headers = None
+    snapshot_writer = None
+    with open(output_file, 'w', newline='', encoding='utf-8') as out:
+        writer = csv.writer(out, lineterminator='\n')
+        for path, label in sources:
+            with open(path, newline='', encoding='utf-8-sig') as f:
+                reader = csv.reader(f)
+                headers = next(reader, None)
+                if not headers:
+                    continue
+                names = schema.canonical_names(headers)
+                if out_headers is None:
+                    out_headers = names
+                    writer.writerow(out_headers + ['Fichier_Source'])
+                    if with_snapshot:
+                        snapshot_writer = snapshot.SnapshotWriter(out_headers + ['Fichier_Source'])
+
+                rows = clean_rows(headers, reader) if clean else reader
+                if names != out_headers:
+                    # En-têtes différents : alignement par nom canonique de colonne
+                    positions = {name: j for j, name in enumerate(names)}
+                    logging.warning(f"En-têtes différents dans {path} - alignement par nom")
+                    rows = ([row[positions[h]] if h in positions else '' for h in out_headers] for row in rows)
+                for row in rows:
+                    row = list(row) + [label]
+                    writer.writerow(row)
+                    if snapshot_writer is not None:
+                        snapshot_writer.add_row(row)
+                    total_rows += 1
+
+    logging.info(f"Fichier consolidé créé: {output_file}")
+    logging.info(f"Total lignes consolidées: {total_rows}")
+    if snapshot_writer is not None:
+        _write_snapshot_file(snapshot_writer, output_file)
+    return total_rows
+
+def build_snapshot(consolidated_file, df=None):
+    """
+    Écrit l'instantané binaire (snapshot.py) à côté du fichier consolidé
+    df : DataFrame déjà en mémoire ; sinon le consolidé est relu en flux (csv), sans pandas
+    Retourne le chemin de l'instantané, ou None en cas d'erreur
+    """
+    import csv
+    import snapshot
+
+    if df is None:
+        try:
+            with open(consolidated_file, newline='', encoding='utf-8-sig') as f:
+                reader = csv.reader(f)
+                writer = snapshot.SnapshotWriter(next(reader, []))
+                for row in reader:
+                    writer.add_row(row)
+        except Exception as e:
+            logging.error(f"Erreur lors de l'écriture de l'instantané: {str(e)}")
+            return None
+        return _write_snapshot_file(writer, consolidated_file)
+
+    try:
+        path = snapshot.write_snapshot(df, snapshot.snapshot_path(consolidated_file),
+                                       source=os.path.basename(consolidated_file))
+        logging.info(f"Instantané binaire créé: {path} ({len(df)} lignes)")
+        return path
+    except Exception as e:
+        logging.error(f"Erreur lors de l'écriture de l'instantané: {str(e)}")
+        return None
+
+def _write_snapshot_file(writer, consolidated_file):
+    """Écrit l'instantané d'un SnapshotWriter à côté du consolidé ; chemin ou None en cas d'erreur"""
+    import snapshot
+
+    try:
+        path = writer.write(snapshot.snapshot_path(consolidated_file), source=os.path.basename(consolidated_file))
+        logging.info(f"Instantané binaire créé: {path} ({len(writer)} lignes)")
+        return path
+    except Exception as e:
+        logging.error(f"Erreur lors de l'écriture de l'instantané: {str(e)}")
+        return None
+
+def open_snapshot(path="scansante_master_cleaned.snap"):
+    """
+    Ouvre un instantané sans copie (mmap) : colonnes en vues NumPy
+    path : fichier .snap, ou fichier consolidé .csv dont on prend l'instantané
+    """
+    import snapshot
+
+    if not path.endswith(snapshot.SNAPSHOT_EXTENSION):
+        path = snapshot.snapshot_path(path)
+    return snapshot.Snapshot(path)
+
+def load_snapshot(path="scansante_master_cleaned.snap", columns=None):
+    """
+    Charge un instantané en DataFrame (comptages int32 et ratios float32 sans copie,
+    textes en category) ; columns : noms de colonnes à charger (défaut : toutes)
+    """
+    return open_snapshot(path).to_dataframe(columns)
+
 if __name__ == "__main__":
+    setup_logging()
     logging.info("=== DÉBUT DU NETTOYAGE DES DONNÉES ===")
 
     # Nettoyage des fichiers individuels
@@ -4,24 +4,211 @@ Script final d'automatisation ScanSante
 Scrape les tableaux HTML au lieu de télécharger les fichiers Excel
 """
 
-import requests
 import time
 import os
 from urllib.parse import urljoin
 import logging
-import pandas as pd
-from bs4 import BeautifulSoup
 import re
+import threading
+
+# Dépendances lourdes (requests, BeautifulSoup, pandas, NumPy) importées à la
+# première utilisation : l'import du module et la création de l'instance
+# restent quasi instantanés (dashboard, CLI, listing des combinaisons)
+
+_logging_configured = False
+
+MANIFEST_FILENAME = "manifest.jsonl"
+FUSED_MODES = (None, 'raw+clean', 'clean')
+
+
+YEARS = ['2024', '2023', '2022', '2021', '2020', '2019', '2018', '2017', '2016', '2015']
+BASES = ['bpub', 'bpri', 'ball']
+ACTIVITIES = {'M': 'medecine', 'C': 'chirurgie', 'O': 'obstetrique'}
+CATEGORIES = {'C': 'chirurgie', 'O14': 'obstetrique', 'O15': 'nouveau_nes', 'PI': 'peu_invasif'}
+
+# Niveaux de détail "Autres regroupements de GHM" (du plus large au plus fin, voir ghm_drilldown)
+DRILL_LEVELS = ['DA', 'GP', 'racine', 'GHM']
+
+
+def cleaned_tree(output_dir):
+    """Arbre des CSV nettoyés associé à un arbre brut (donnees_scansante -> donnees_scansante_cleaned)"""
+    return f"{output_dir.rstrip(os.sep + '/')}_cleaned"
+
+
+def manifest_entry_file(output_dir, entry):
+    """Chemin du fichier d'une entrée de manifeste (arbre nettoyé si 'cleaned') ; None sans fichier"""
+    if not entry.get('path'):
+        return None
+    tree = cleaned_tree(output_dir) if entry.get('cleaned') else output_dir
+    return os.path.join(tree, entry['path'])
+
+
+def drill_level(params):
+    """(niveau, code) le plus fin renseigné parmi DA / GP / racine / GHM, ou None"""
+    for level in reversed(DRILL_LEVELS):
+        if params.get(level):
+            return level, params[level]
+    return None
+
+
+def combination_type(params):
+    """Nom court du type de données (tous_sejours, activite_medecine, categorie_chirurgie...)"""
+    drill = drill_level(params)
+    if drill:
+        return f"{drill[0].lower()}_{drill[1]}"
+    if params['typrgp'] == 'tous':
+        return "tous_sejours"
+    elif params.get('ASO'):
+        return f"activite_{ACTIVITIES.get(params['ASO'], params['ASO'])}"
+    elif params.get('CAS'):
+        return f"categorie_{CATEGORIES.get(params['CAS'], params['CAS'])}"
+    return "autre"
+
+
+def combination_key(params):
+    """Clé stable identifiant une combinaison (indépendante de l'ordre de la liste)"""
+    key = "|".join([params['annee'], params['tgeo'], params['codegeo'], params['base'],
+                    params['typrgp'], params.get('ASO', ''), params.get('CAS', '')])
+    drill = drill_level(params)
+    if drill:
+        key += f"|{drill[0]}={drill[1]}"
+    return key
+
+
+def shard_of(params, shard_count):
+    """Numéro de shard (0..N-1) déterministe d'une combinaison, identique sur toutes les machines"""
+    import hashlib
+
+    digest = hashlib.sha1(combination_key(params).encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % shard_count
+
+
+def parse_shard(value):
+    """Convertit "i/N" (1 <= i <= N) en (index 0-based, N)"""
+    import argparse
+
+    try:
+        index, count = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"format attendu i/N, reçu: {value}")
+    if count < 1 or not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(f"shard invalide: {value} (1 <= i <= N)")
+    return index - 1, count
+
+
+def parse_table_html(content):
+    """Extrait en-têtes et lignes du tableau de données d'une page /submit
+
+    Retourne (None, []) si aucun tableau n'est présent, ([], []) si aucun
+    tableau n'a d'en-têtes exploitables, sinon (headers, rows_data).
+    Fonction pure (sans état) : peut tourner dans un thread ou un process.
+    """
+    from bs4 import BeautifulSoup
+
+    # Parser le HTML avec BeautifulSoup
+    soup = BeautifulSoup(content, 'html.parser')
+
+    # Trouver tous les tableaux avec class="table"
+    tables = soup.find_all('table', class_='table')
+    if not tables:
+        return None, []
+
+    # Chercher le bon tableau (celui avec des données)
+    data_table = None
+    headers = []
+
+    for table in tables:
+        # Chercher les en-têtes de colonnes
+        thead = table.find('thead')
+        if thead:
+            header_row = thead.find('tr')
+            if header_row:
+                potential_headers = [th.get_text(strip=True).replace('\n', ' ').replace('<br>', ' ')
+                                   for th in header_row.find_all('th')]
+                # Vérifier si ce tableau a plus d'une colonne (données utiles)
+                if len(potential_headers) > 3:
+                    headers = potential_headers
+                    data_table = table
+                    break
+
+    if not data_table or not headers:
+        return [], []
+
+    # Extraire les données du tbody
+    rows_data = []
+    tbody = data_table.find('tbody')
+    if tbody:
+        for row in tbody.find_all('tr'):
+            cells = row.find_all('td')
+            if cells:
+                row_data = []
+                for cell in cells:
+                    # Nettoyer le texte des cellules
+                    cell_text = cell.get_text(strip=True)
+                    # Supprimer les espaces en trop et normaliser
+                    cell_text = re.sub(r'\s+', ' ', cell_text)
+                    row_data.append(cell_text)
+                rows_data.append(row_data)
+
+    return headers, rows_data
+
 
 class ScanSanteFinalAutomation:
-    def __init__(self, output_dir="donnees_scansante"):
+    def __init__(self, output_dir="donnees_scansante", fused=None, consolidated_file="scansante_master_cleaned.csv"):
+        """
+        fused : mode fusionné scraping + nettoyage en une passe
+                None (défaut) : CSV brut seulement, nettoyage en fin de run
+                'raw+clean' : CSV brut + CSV nettoyé + ligne(s) du fichier consolidé
+                'clean' : CSV nettoyé + fichier consolidé seulement
+        """
+        if fused not in FUSED_MODES:
+            raise ValueError(f"Mode fusionné inconnu: {fused} (attendu: {FUSED_MODES})")
+
         self.base_url = "https://www.scansante.fr"
+        self.main_path = "/applications/cartographie-activite-MCO"
         self.submit_url = "/applications/cartographie-activite-MCO/submit"
-        self.session = requests.Session()
+        self._session = None
         self.output_dir = output_dir
-        self.setup_logging()
-        self.setup_session()
-        self.create_directory_structure()
+        self.http_headers = {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+            'Accept-Language': 'fr-FR,fr;q=0.8,en-US;q=0.5,en;q=0.3',
+            'Accept-Encoding': 'gzip, deflate',
+            'Connection': 'keep-alive',
+            'Referer': self.base_url + self.main_path
+        }
+
+        # Timeouts séparés (connexion, lecture) et taille du pool HTTP keep-alive
+        self.connect_timeout = 10
+        self.read_timeout = 30
+        self.timeout = (self.connect_timeout, self.read_timeout)
+        self.pool_maxsize = 10
+        self._session_ready = False
+
+        # Nouvelles tentatives immédiates si le tableau ne se rapproche pas de sa ligne Total
+        self.reconcile_retries = 2
+
+        # Mode fusionné : sorties nettoyées écrites directement par le scraper
+        self.fused = fused
+        self.cleaned_dir = cleaned_tree(output_dir)
+        self.consolidated_file = consolidated_file
+        self._consolidated_lock = threading.Lock()
+        self._consolidated_sources = None
+        self._consolidated_headers = None
+
+        # Manifeste du run : une ligne JSON par combinaison traitée (fusion des shards)
+        self.manifest_file = os.path.join(output_dir, MANIFEST_FILENAME)
+        self._manifest_lock = threading.Lock()
+
+        # Logging configuré et dossiers créés au premier usage seulement
+        self.logger = logging.getLogger(__name__)
+
+    @property
+    def session(self):
+        """Session requests créée à la première requête"""
+        if self._session is None:
+            self.setup_session()
+        return self._session
 
     def create_directory_structure(self):
         """Crée une structure de dossiers organisée par critères"""
@@ -86,7 +273,11 @@ class ScanSanteFinalAutomation:
             etab_folder = "D_Autres"
 
         # Déterminer le type de données
-        if params['typrgp'] == 'tous':
+        drill = drill_level(params)
+        if drill:
+            level_folders = {'DA': '1_DA', 'GP': '2_GP', 'racine': '3_Racines', 'GHM': '4_GHM'}
+            data_folder = os.path.join("4_Regroupements_GHM", level_folders[drill[0]])
+        elif params['typrgp'] == 'tous':
             data_folder = "1_Tous_sejours"
         elif params.get('ASO'):
             data_folder = "2_Activites_soins"
@@ -99,138 +290,322 @@ class ScanSanteFinalAutomation:
         return os.path.join(self.output_dir, geo_folder, etab_folder, data_folder)
     
     def setup_logging(self):
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler('scansante_final.log', encoding='utf-8'),
-                logging.StreamHandler()
-            ]
-        )
+        """Configure le logging global (une seule fois par process)"""
+        global _logging_configured
+        self.logger = logging.getLogger(__name__)
+        if _logging_configured:
+            return
+        _logging_configured = True
+
+        # Threads de scraping : une mise en file par log ; écritures (JSON, rotation) dans le listener
+        from queue_logging import start_queue_logging
+        start_queue_logging('scansante_final.log')
         self.logger = logging.getLogger(__name__)
     
     def setup_session(self):
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-            'Accept-Language': 'fr-FR,fr;q=0.8,en-US;q=0.5,en;q=0.3',
-            'Accept-Encoding': 'gzip, deflate',
-            'Connection': 'keep-alive',
-            'Referer': self.base_url + '/applications/cartographie-activite-MCO'
-        })
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self._session = requests.Session()
+        self._session.headers.update(self.http_headers)
+
+        # Pool de connexions explicite : réutilise les sockets keep-alive
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.pool_maxsize,
+            max_retries=0
+        )
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
     
+    def build_submit_params(self, params):
+        """Construit les paramètres de la requête GET /submit pour une combinaison"""
+        return {
+            'snatnav': '',
+            'annee': params['annee'],
+            'tgeo': params['tgeo'],
+            'codegeo': params['codegeo'],
+            'base': params['base'],
+            'ASO': params.get('ASO', ''),
+            'CAS': params.get('CAS', ''),
+            'typrgp': params['typrgp'],
+            'DA': params.get('DA', ''),
+            'GP': params.get('GP', ''),
+            'racine': params.get('racine', ''),
+            'GHM': params.get('GHM', '')
+        }
+
+    def ensure_session(self):
+        """Visite la page principale une seule fois pour établir la session (cookies)"""
+        if self._session_ready:
+            return True
+
+        self.setup_logging()
+
+        main_page = self.session.get(self.base_url + self.main_path, timeout=self.timeout)
+        if main_page.status_code != 200:
+            self.logger.error(f"Erreur page principale: {main_page.status_code}")
+            return False
+
+        self._session_ready = True
+        return True
+
+    def fetch_submit(self, params):
+        """GET /submit pour une combinaison ; contenu HTML ou None en cas d'erreur"""
+        # Etape 0: Visiter la page principale pour établir la session
+        if not self.ensure_session():
+            return None
+
+        # Etape 1: Faire le GET submit pour générer les données
+        submit_params = self.build_submit_params(params)
+        submit_response = self.session.get(self.base_url + self.submit_url, params=submit_params, timeout=self.timeout)
+        if submit_response.status_code != 200:
+            self.logger.error(f"Erreur submit: {submit_response.status_code}")
+            return None
+        return submit_response.content
+
     def scrape_table_data(self, params):
         """Scrape les données du tableau HTML au lieu de télécharger Excel"""
         try:
-            # Etape 0: Visiter la page principale pour établir la session
-            main_page = self.session.get(self.base_url + '/applications/cartographie-activite-MCO', timeout=30)
-            if main_page.status_code != 200:
-                self.logger.error(f"Erreur page principale: {main_page.status_code}")
-                return False
-
-            # Etape 1: Faire le GET submit pour générer les données
-            submit_params = {
-                'snatnav': '',
-                'annee': params['annee'],
-                'tgeo': params['tgeo'],
-                'codegeo': params['codegeo'],
-                'base': params['base'],
-                'ASO': params.get('ASO', ''),
-                'CAS': params.get('CAS', ''),
-                'typrgp': params['typrgp'],
-                'DA': '',
-                'GP': '',
-                'racine': '',
-                'GHM': ''
-            }
-
-            submit_response = self.session.get(self.base_url + self.submit_url, params=submit_params, timeout=30)
-            if submit_response.status_code != 200:
-                self.logger.error(f"Erreur submit: {submit_response.status_code}")
-                return False
-
-            # Parser le HTML avec BeautifulSoup
-            soup = BeautifulSoup(submit_response.content, 'html.parser')
-
-            # Trouver tous les tableaux avec class="table"
-            tables = soup.find_all('table', class_='table')
-            if not tables:
-                self.logger.error("Aucun tableau trouvé")
-                return False
-
-            # Chercher le bon tableau (celui avec des données)
-            data_table = None
-            headers = []
-
-            for table in tables:
-                # Chercher les en-têtes de colonnes
-                thead = table.find('thead')
-                if thead:
-                    header_row = thead.find('tr')
-                    if header_row:
-                        potential_headers = [th.get_text(strip=True).replace('\n', ' ').replace('<br>', ' ')
-                                           for th in header_row.find_all('th')]
-                        # Vérifier si ce tableau a plus d'une colonne (données utiles)
-                        if len(potential_headers) > 3:
-                            headers = potential_headers
-                            data_table = table
-                            break
-
-            if not data_table or not headers:
-                self.logger.error("Tableau de données avec en-têtes non trouvé")
-                # Debug: afficher les tableaux trouvés
-                for i, table in enumerate(tables):
-                    self.logger.info(f"Tableau {i+1}: {len(table.find_all('td'))} cellules")
-                return False
-
-            # Extraire les données du tbody
-            rows_data = []
-            tbody = data_table.find('tbody')
-            if tbody:
-                for row in tbody.find_all('tr'):
-                    cells = row.find_all('td')
-                    if cells:
-                        row_data = []
-                        for cell in cells:
-                            # Nettoyer le texte des cellules
-                            cell_text = cell.get_text(strip=True)
-                            # Supprimer les espaces en trop et normaliser
-                            cell_text = re.sub(r'\s+', ' ', cell_text)
-                            row_data.append(cell_text)
-                        rows_data.append(row_data)
-
-            if not rows_data:
-                self.logger.warning("Aucune donnée trouvée dans le tableau - zone probablement vide")
-                return "empty"
-
-            # Vérifier si les données sont significatives (plus de quelques lignes)
-            if len(rows_data) < 3:
-                self.logger.warning(f"Très peu de données ({len(rows_data)} lignes) - zone probablement peu significative")
-                return "minimal"
-
-            # Créer un DataFrame avec les données
-            df = pd.DataFrame(rows_data, columns=headers)
-
-            # Sauvegarder en CSV dans le dossier organisé
-            organized_dir = self.get_organized_filepath(params)
-            filename = self.generate_filename(params, extension='csv')
-            filepath = os.path.join(organized_dir, filename)
-
-            # Créer le dossier si nécessaire
-            if not os.path.exists(organized_dir):
-                os.makedirs(organized_dir)
+            for attempt in range(self.reconcile_retries + 1):
+                content = self.fetch_submit(params)
+                if content is None:
+                    return False
 
-            df.to_csv(filepath, index=False, encoding='utf-8-sig')
+                retry = attempt < self.reconcile_retries
+                result = self.process_response(params, content, retry_on_mismatch=retry)
+                if result != "mismatch" or not retry:
+                    return result
+                self.logger.info(f"Nouvelle tentative immédiate ({attempt + 1}/{self.reconcile_retries})")
 
-            # Log relatif pour clarté
-            relative_path = os.path.relpath(filepath, self.output_dir)
-            self.logger.info(f"SUCCESS: {relative_path} ({len(rows_data)} lignes, {len(headers)} colonnes)")
-            return True
+        except Exception as e:
+            self.logger.error(f"Erreur lors du scraping: {e}")
+            return False
 
+    def fetch_table(self, params):
+        """Télécharge et parse le tableau d'une combinaison sans l'écrire : (headers, rows) ou (None, [])"""
+        try:
+            content = self.fetch_submit(params)
         except Exception as e:
             self.logger.error(f"Erreur lors du scraping: {e}")
+            return None, []
+        if content is None:
+            return None, []
+        return parse_table_html(content)
+
+    def process_response(self, params, content, retry_on_mismatch=False):
+        """Parse le HTML d'une réponse /submit et sauvegarde le tableau en CSV
+
+        Partagé entre le client synchrone (requests) et le client asynchrone
+        (async_client), qui l'exécute dans un executor hors de la boucle asyncio.
+
+        Le tableau est rapproché de sa ligne Total (CompactTable.reconcile) :
+        en cas d'écart, retourne "mismatch" sans rien écrire si retry_on_mismatch
+        (l'appelant retente aussitôt), sinon écrit le fichier avec le statut
+        "mismatch" dans le manifeste.
+        """
+        from compact_table import CompactTable
+
+        headers, rows_data = parse_table_html(content)
+
+        if headers is None:
+            self.logger.error("Aucun tableau trouvé")
             return False
-    
+
+        if not headers:
+            self.logger.error("Tableau de données avec en-têtes non trouvé")
+            return False
+
+        if not rows_data:
+            self.logger.warning("Aucune donnée trouvée dans le tableau - zone probablement vide")
+            self.record_manifest(params, "empty")
+            return "empty"
+
+        # Vérifier si les données sont significatives (plus de quelques lignes)
+        if len(rows_data) < 3:
+            self.logger.warning(f"Très peu de données ({len(rows_data)} lignes) - zone probablement peu significative")
+            self.record_manifest(params, "minimal", rows=len(rows_data))
+            return "minimal"
+
+        # Colonnes typées compactes (int32 / float32 / catégories) au lieu d'un DataFrame object
+        table = CompactTable.from_rows(headers, rows_data)
+
+        # Rapprochement avec la ligne Total : détecte les réponses tronquées
+        reconciliation = table.reconcile()
+        if not reconciliation['ok']:
+            self.logger.warning(f"Rapprochement avec la ligne Total en échec "
+                                f"({', '.join(reconciliation['failures'])}) - {combination_key(params)}")
+            if retry_on_mismatch:
+                return "mismatch"
+        status = "ok" if reconciliation['ok'] else "mismatch"
+
+        # Sauvegarder en CSV dans le dossier organisé
+        organized_dir = self.get_organized_filepath(params)
+        filename = self.generate_filename(params, extension='csv')
+        filepath = os.path.join(organized_dir, filename)
+
+        relative_path = os.path.relpath(filepath, self.output_dir)
+        manifest_path, sha256 = relative_path, None
+        if self.fused != 'clean':
+            # Créer le dossier si nécessaire
+            if not os.path.exists(organized_dir):
+                os.makedirs(organized_dir, exist_ok=True)
+            sha256 = table.write_csv(filepath, encoding='utf-8-sig')
+        if self.fused:
+            cleaned_path, cleaned_sha256 = self.write_cleaned_outputs(relative_path, headers, rows_data)
+            if self.fused == 'clean':
+                # Pas de CSV brut : le manifeste pointe sur le CSV nettoyé (fusion, reprise)
+                manifest_path, sha256 = cleaned_path, cleaned_sha256
+
+        # Log relatif pour clarté
+        self.record_manifest(params, status, path=manifest_path, rows=len(rows_data), sha256=sha256,
+                             reconciliation=reconciliation, cleaned=self.fused == 'clean')
+        if status == "mismatch":
+            self.logger.warning(f"ÉCART TOTAL: {relative_path} ({len(rows_data)} lignes, {len(headers)} colonnes)")
+            return "mismatch"
+        self.logger.info(f"SUCCESS: {relative_path} ({len(rows_data)} lignes, {len(headers)} colonnes)")
+        return True
+
+    def write_cleaned_outputs(self, relative_path, headers, rows_data):
+        """Mode fusionné : nettoie en mémoire, écrit le CSV nettoyé et alimente le consolidé
+
+        Remplace la relecture du CSV brut (clean_csv_file) puis du CSV nettoyé
+        (create_consolidated_file) : une seule écriture par combinaison.
+        Retourne (chemin du CSV nettoyé relatif à cleaned_dir, empreinte SHA-256).
+        """
+        import csv
+        import data_cleaner
+        import schema
+        import shard_merge
+
+        cleaned_rows = list(data_cleaner.clean_rows(headers, rows_data))
+
+        # CSV nettoyé (arborescence miroir du brut, nom préfixé cleaned_)
+        directory, filename = os.path.split(relative_path)
+        cleaned_path = os.path.join(directory, f"cleaned_{filename}")
+        os.makedirs(os.path.join(self.cleaned_dir, directory), exist_ok=True)
+        cleaned_file = os.path.join(self.cleaned_dir, cleaned_path)
+        data_cleaner.write_rows(cleaned_file, headers, cleaned_rows)
+
+        # Ajout au fichier consolidé (en-têtes canoniques, Fichier_Source = chemin relatif du brut)
+        if self.consolidated_file:
+            source = relative_path.replace(os.sep, '/')
+            names = schema.canonical_names(headers)
+            with self._consolidated_lock:
+                sources = self._load_consolidated_sources()
+                if source in sources:
+                    # Combinaison déjà présente (nouvelle tentative, relance) : ses lignes sont remplacées
+                    self._drop_consolidated_source(source)
+                new_file = not os.path.exists(self.consolidated_file)
+                if new_file:
+                    self._consolidated_headers = names + ['Fichier_Source']
+                columns = self._consolidated_headers
+                if names + ['Fichier_Source'] != columns:
+                    # En-têtes différents du consolidé : alignement par nom canonique de colonne
+                    dropped = [name for name in names if name not in columns]
+                    self.logger.warning(f"En-têtes différents dans {source} - alignement par nom"
+                                        + (f", colonnes ignorées: {', '.join(dropped)}" if dropped else ""))
+                positions = {name: j for j, name in enumerate(names)}
+                with open(self.consolidated_file, 'a', newline='', encoding='utf-8') as f:
+                    writer = csv.writer(f, lineterminator='\n')
+                    if new_file:
+                        writer.writerow(columns)
+                    writer.writerows(
+                        [source if name == 'Fichier_Source' else row[positions[name]] if name in positions else ''
+                         for name in columns]
+                        for row in cleaned_rows
+                    )
+                sources.add(source)
+
+        return cleaned_path.replace(os.sep, '/'), shard_merge.file_sha256(cleaned_file)
+
+    def _load_consolidated_sources(self):
+        """Fichier_Source déjà présents dans le consolidé (lu une fois, puis tenu à jour)
+
+        Les en-têtes du consolidé sont lus au passage (_consolidated_headers).
+        """
+        import csv
+
+        if self._consolidated_sources is None:
+            self._consolidated_sources = set()
+            if os.path.exists(self.consolidated_file):
+                with open(self.consolidated_file, newline='', encoding='utf-8') as f:
+                    reader = csv.reader(f)
+                    headers = next(reader, [])
+                    self._consolidated_headers = headers
+                    if 'Fichier_Source' in headers:
+                        j = headers.index('Fichier_Source')
+                        self._consolidated_sources.update(row[j] for row in reader if len(row) > j)
+        return self._consolidated_sources
+
+    def _drop_consolidated_source(self, source):
+        """Réécrit le consolidé sans les lignes d'un Fichier_Source (cas rare : en flux)"""
+        import csv
+
+        tmp = self.consolidated_file + '.tmp'
+        with open(self.consolidated_file, newline='', encoding='utf-8') as f, \
+                open(tmp, 'w', newline='', encoding='utf-8') as out:
+            reader = csv.reader(f)
+            writer = csv.writer(out, lineterminator='\n')
+            headers = next(reader, [])
+            writer.writerow(headers)
+            j = headers.index('Fichier_Source')
+            writer.writerows(row for row in reader if len(row) <= j or row[j] != source)
+        os.replace(tmp, self.consolidated_file)
+        self.logger.info(f"Lignes précédentes de {source} retirées du fichier consolidé")
+
+    def record_manifest(self, params, status, path=None, rows=0, sha256=None, origin='scrape',
+                        reconciliation=None, cleaned=False):
+        """Ajoute une ligne au manifeste du run (thread-safe)
+
+        origin : 'scrape' (requête ScanSante) ou 'derived' (calculé localement)
+        reconciliation : rapport de CompactTable.reconcile (écarts à la ligne Total)
+        cleaned : path est relatif à l'arbre nettoyé (mode fusionné 'clean', voir manifest_entry_file)
+        """
+        import json
+        from datetime import datetime
+
+        entry = {
+            'key': combination_key(params),
+            'status': status,
+            'path': path.replace(os.sep, '/') if path else None,
+            'rows': rows,
+            'sha256': sha256,
+            'origin': origin,
+            'cleaned': cleaned,
+            'reconciliation': reconciliation,
+            'scraped_at': datetime.now().isoformat(timespec='seconds')
+        }
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._manifest_lock:
+            os.makedirs(self.output_dir, exist_ok=True)
+            with open(self.manifest_file, 'a', encoding='utf-8') as f:
+                f.write(line)
+
+    def scrape_many(self, combinations, concurrency=32, **client_options):
+        """Scrape une liste de combinaisons en parallèle via le client asynchrone
+
+        Enveloppe synchrone de async_client.AsyncScanSanteClient : retourne la
+        liste des résultats (True / "empty" / "minimal" / False) dans l'ordre
+        des combinaisons.
+        """
+        from async_client import AsyncScanSanteClient
+
+        self.setup_logging()
+        client = AsyncScanSanteClient(self, concurrency=concurrency, **client_options)
+        return client.run(combinations)
+
+    def scrape_scheduled(self, scheduler, concurrency=32, **client_options):
+        """Comme scrape_many, mais en tirant les combinaisons d'un scheduler.PriorityScheduler
+
+        Retourne la liste des (params, résultat) dans l'ordre de fin de traitement.
+        """
+        from async_client import AsyncScanSanteClient
+
+        self.setup_logging()
+        client = AsyncScanSanteClient(self, concurrency=concurrency, **client_options)
+        return client.run_scheduled(scheduler)
+
     def generate_filename(self, params, extension='csv'):
         """Génère un nom de fichier descriptif et organisé"""
 
@@ -238,20 +613,13 @@ class ScanSanteFinalAutomation:
         base_name = f"{params['annee']}"
 
         # Ajouter les spécifications selon le type
-        if params['typrgp'] == 'tous':
-            type_name = "tous_sejours"
-        elif params.get('ASO'):
-            activities = {'M': 'medecine', 'C': 'chirurgie', 'O': 'obstetrique'}
-            type_name = f"activite_{activities.get(params['ASO'], params['ASO'])}"
-        elif params.get('CAS'):
-            categories = {'C': 'chirurgie', 'O14': 'obstetrique', 'O15': 'nouveau_nes', 'PI': 'peu_invasif'}
-            type_name = f"categorie_{categories.get(params['CAS'], params['CAS'])}"
-        else:
-            type_name = "autre"
+        type_name = combination_type(params)
 
-        # Ajouter zone géographique si c'est un département
+        # Ajouter zone géographique si c'est un département ou une région
         if params['tgeo'] == 'de':
             geo_part = f"_dept{params['codegeo']}"
+        elif params['tgeo'] == 're':
+            geo_part = f"_reg{params['codegeo']}"
         else:
             geo_part = ""
 
@@ -396,6 +764,61 @@ class ScanSanteFinalAutomation:
 
         return combinations
 
+    def get_full_combinations(self):
+        """Génère l'espace complet : années x zones x types d'établissement x types de données"""
+        zones = self.get_all_geographic_zones()
+        zone_priority = [('france', 'critical'), ('regions', 'high'), ('departments', 'medium')]
+        data_types = [('tous', '', '')]
+        data_types += [('rgpGHM', aso, '') for aso in ACTIVITIES]
+        data_types += [('rgpGHM', '', cas) for cas in CATEGORIES]
+
+        combinations = []
+        for year in YEARS:
+            for group, priority in zone_priority:
+                for tgeo, codegeo in zones[group]:
+                    for base in BASES:
+                        for typrgp, aso, cas in data_types:
+                            params = {
+                                'annee': year,
+                                'tgeo': tgeo,
+                                'codegeo': codegeo,
+                                'base': base,
+                                'ASO': aso,
+                                'CAS': cas,
+                                'typrgp': typrgp,
+                                'priority': priority
+                            }
+                            if self.validate_combination(params):
+                                combinations.append(params)
+        return combinations
+
+    def filter_combinations(self, combinations, years=None, bases=None, zones=None, types=None, shard=None):
+        """Filtre une liste de combinaisons
+
+        years : années ('2024'...), bases : 'bpub' / 'bpri' / 'ball'
+        zones : groupes ('france', 'regions', 'departments') ou zones précises ('de:75', 're:11')
+        types : noms de type de données ('tous_sejours', 'activite_medecine', ...)
+        shard : (index, N) ne garde que la tranche déterministe index sur N
+        """
+        tgeo_groups = {'france': 'fe', 'regions': 're', 'departments': 'de'}
+        selected = []
+        for params in combinations:
+            if years and params['annee'] not in years:
+                continue
+            if bases and params['base'] not in bases:
+                continue
+            if zones and not any(
+                zone == f"{params['tgeo']}:{params['codegeo']}" or tgeo_groups.get(zone) == params['tgeo']
+                for zone in zones
+            ):
+                continue
+            if types and combination_type(params) not in types:
+                continue
+            if shard and shard_of(params, shard[1]) != shard[0]:
+                continue
+            selected.append(params)
+        return selected
+
     def generate_all_combinations(self):
         """Wrapper pour compatibilité - utilise désormais l'approche stratégique"""
         return self.get_strategic_combinations()
@@ -415,59 +838,106 @@ class ScanSanteFinalAutomation:
 
         return True
     
-    def run_full_automation(self, delay=2, max_combinations=None):
-        """Lance l'automatisation complète avec option de limitation"""
+    def run_full_automation(self, delay=2, max_combinations=None, combinations=None, concurrency=1, clean=True,
+                            time_budget=None, request_budget=None, should_stop=None, on_result=None):
+        """Lance l'automatisation complète avec option de limitation
+
+        combinations : liste à traiter (par défaut les combinaisons stratégiques)
+        concurrency : > 1 pour passer par le client asynchrone (scrape_scheduled)
+        clean : lance le nettoyage et la consolidation à la fin
+        time_budget / request_budget : arrêt après N secondes / N requêtes ; les
+            combinaisons sont traitées par priorité (critical d'abord, années
+            alternées) via scheduler.PriorityScheduler
+        should_stop : fonction sans argument, arrêt anticipé si elle retourne True
+        on_result : fonction (params, résultat) appelée après chaque requête
+        """
+        from scheduler import PriorityScheduler
+
+        self.setup_logging()
         self.logger.info("Début de l'automatisation ScanSante COMPLÈTE avec scraping HTML")
 
         # Estimer le nombre total
         self.estimate_total_combinations()
 
-        combinations = self.generate_all_combinations()
+        if combinations is None:
+            combinations = self.generate_all_combinations()
         total_combinations = len(combinations)
 
+        # Mode fusionné : le consolidé est reconstruit au fil du run
+        if self.fused and self.consolidated_file and os.path.exists(self.consolidated_file):
+            os.remove(self.consolidated_file)
+            self._consolidated_sources = None
+
         if max_combinations and max_combinations < total_combinations:
             combinations = combinations[:max_combinations]
             self.logger.info(f"LIMITATION: Traitement des {max_combinations} premières combinaisons sur {total_combinations}")
         else:
             self.logger.info(f"Traitement de TOUTES les {total_combinations:,} combinaisons")
 
+        valid = [params for params in combinations if self.validate_combination(params)]
+        if len(valid) < len(combinations):
+            self.logger.info(f"SKIPPED: {len(combinations) - len(valid)} combinaisons non valides")
+        scheduler = PriorityScheduler(valid, time_budget=time_budget, request_budget=request_budget,
+                                      should_stop=should_stop)
+        if time_budget or request_budget:
+            time_desc = f"{time_budget / 60:.0f} min" if time_budget else "temps illimité"
+            request_desc = f"{request_budget:,} requêtes" if request_budget else "requêtes illimitées"
+            self.logger.info(f"Budget: {time_desc}, {request_desc} - priorités {scheduler.remaining_by_priority()}")
+
         successful_scrapes = 0
         failed_scrapes = 0
         empty_zones = 0
         minimal_data = 0
+        mismatches = 0
         start_time = time.time()
 
-        for i, params in enumerate(combinations, 1):
-            # Valider la combinaison d'abord
-            if not self.validate_combination(params):
-                self.logger.info(f"[{i}/{len(combinations)}] SKIPPED: Combinaison non valide")
-                continue
-
-            # Log détaillé tous les 50 éléments
-            if i % 50 == 0 or i == 1:
-                elapsed = time.time() - start_time
-                estimated_total = (elapsed / i) * len(combinations) if i > 0 else 0
-                self.logger.info(f"[{i}/{len(combinations)}] - Temps écoulé: {elapsed/60:.1f}min - ETA: {estimated_total/60:.1f}min")
-
-            # Log basique pour chaque élément
-            zone_desc = f"{params['tgeo']}:{params['codegeo']}"
-            priority = params.get('priority', 'normal')
-            self.logger.info(f"[{i}/{len(combinations)}] {params['annee']} {zone_desc} {params['base']} {params['typrgp']} ({priority})")
-
-            result = self.scrape_table_data(params)
+        def count(params, result):
+            nonlocal successful_scrapes, failed_scrapes, empty_zones, minimal_data, mismatches
             if result == True:
                 successful_scrapes += 1
             elif result == "empty":
                 empty_zones += 1
-                self.logger.info(f"Zone vide détectée: {zone_desc} - peut être ignorée pour futures requêtes similaires")
+                self.logger.info(f"Zone vide détectée: {params['tgeo']}:{params['codegeo']} - "
+                                 f"peut être ignorée pour futures requêtes similaires")
             elif result == "minimal":
                 minimal_data += 1
                 successful_scrapes += 1  # On garde quand même
+            elif result == "mismatch":
+                mismatches += 1  # Fichier écrit, mais écart persistant à la ligne Total
             else:
                 failed_scrapes += 1
+            if on_result:
+                on_result(params, result)
 
-            # Pause respectueuse entre requêtes
-            time.sleep(delay)
+        if concurrency > 1:
+            self.logger.info(f"Scraping asynchrone de {len(valid):,} combinaisons (concurrence: {concurrency})")
+            for params, result in self.scrape_scheduled(scheduler, concurrency=concurrency, delay=delay):
+                count(params, result)
+        else:
+            for params in scheduler:
+                i = scheduler.requests
+                # Log détaillé tous les 50 éléments
+                if i % 50 == 0 or i == 1:
+                    elapsed = time.time() - start_time
+                    estimated_total = (elapsed / i) * len(valid) if i > 0 else 0
+                    self.logger.info(f"[{i}/{len(valid)}] - Temps écoulé: {elapsed/60:.1f}min - ETA: {estimated_total/60:.1f}min")
+
+                # Log basique pour chaque élément
+                zone_desc = f"{params['tgeo']}:{params['codegeo']}"
+                priority = params.get('priority', 'normal')
+                self.logger.info(f"[{i}/{len(valid)}] {params['annee']} {zone_desc} {params['base']} {params['typrgp']} ({priority})")
+
+                result = self.scrape_table_data(params)
+                scheduler.record(params, result)
+                count(params, result)
+
+                # Pause respectueuse entre requêtes
+                time.sleep(delay)
+
+        if scheduler.stop_reason:
+            self.logger.warning(f"Arrêt: {scheduler.stop_reason} - non traitées: {scheduler.remaining_by_priority()}")
+        if scheduler.retries:
+            self.logger.info(f"Nouvelles tentatives après échec: {scheduler.retries:,}")
 
         total_time = time.time() - start_time
         self.logger.info(f"Automatisation terminee en {total_time/60:.1f} minutes!")
@@ -475,20 +945,33 @@ class ScanSanteFinalAutomation:
         self.logger.info(f"Zones vides detestees: {empty_zones:,}")
         self.logger.info(f"Donnees minimales: {minimal_data:,}")
         self.logger.info(f"Echecs techniques: {failed_scrapes:,}")
+        self.logger.info(f"Ecarts a la ligne Total: {mismatches:,}")
         self.logger.info(f"Dossier: {self.output_dir}")
 
+        if not clean:
+            return successful_scrapes
+
+        if self.fused:
+            self.logger.info(f"Mode fusionné '{self.fused}': fichiers nettoyés dans {self.cleaned_dir}, "
+                             f"consolidé {self.consolidated_file} - pas de passe de nettoyage séparée")
+            if self.consolidated_file and os.path.exists(self.consolidated_file):
+                import data_cleaner
+                data_cleaner.build_snapshot(self.consolidated_file)
+            self.build_dashboard_aggregates()
+            return successful_scrapes
+
         # Lancement automatique du nettoyage des données
         self.logger.info("=== LANCEMENT DU NETTOYAGE DES DONNÉES ===")
         try:
             import data_cleaner
 
             # Nettoyer les fichiers CSV
-            data_cleaner.clean_all_csv_files(input_dir=self.output_dir, output_dir=f"{self.output_dir}_cleaned")
+            data_cleaner.clean_all_csv_files(input_dir=self.output_dir, output_dir=self.cleaned_dir)
 
             # Créer le fichier consolidé
             data_cleaner.create_consolidated_file(
-                input_dir=f"{self.output_dir}_cleaned",
-                output_file="scansante_master_cleaned.csv"
+                input_dir=self.cleaned_dir,
+                output_file=self.consolidated_file
             )
 
             self.logger.info("=== NETTOYAGE TERMINÉ AVEC SUCCÈS ===")
@@ -496,19 +979,27 @@ class ScanSanteFinalAutomation:
             self.logger.error(f"Erreur lors du nettoyage des données: {str(e)}")
             self.logger.info("Les fichiers bruts restent disponibles dans {self.output_dir}")
 
+        self.build_dashboard_aggregates()
         return successful_scrapes
 
+    def build_dashboard_aggregates(self):
+        """Recalcule les agrégats du tableau de bord (dashboard_aggregates) après consolidation"""
+        try:
+            import dashboard_aggregates
+            dashboard_aggregates.build_aggregates(self.output_dir)
+        except Exception as e:
+            self.logger.error(f"Erreur lors du calcul des agrégats du tableau de bord: {e}")
+
     def run_limited_test(self, limit=100):
         """Lance un test limité avec un sous-ensemble de combinaisons"""
         self.logger.info(f"Test limité avec {limit} combinaisons")
         return self.run_full_automation(delay=1, max_combinations=limit)
 
-if __name__ == "__main__":
+def interactive_main(automation):
+    """Mode interactif historique (lancé sans sous-commande)"""
     print("ScanSante - Automatisation OPTIMISEE")
     print("====================================")
 
-    automation = ScanSanteFinalAutomation()
-
     # Calculer le nombre réel de combinaisons
     combinations = automation.get_strategic_combinations()
     total_combinations = len(combinations)
@@ -545,4 +1036,223 @@ if __name__ == "__main__":
         else:
             print("Automatisation annulee")
 
-    print(f"Dossier de sortie: {automation.output_dir}")
\ No newline at end of file
+    print(f"Dossier de sortie: {automation.output_dir}")
+
+
+def build_arg_parser():
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog='final_automation.py',
+        description="Automatisation ScanSante (sans sous-commande : mode interactif)"
+    )
+    subparsers = parser.add_subparsers(dest='command')
+
+    def add_selection_arguments(sub):
+        sub.add_argument('--scope', choices=['strategique', 'complet'], default='strategique',
+                         help="combinaisons stratégiques (~250) ou espace complet (toutes zones)")
+        sub.add_argument('--years', nargs='+', metavar='ANNEE', help="ex: 2023 2024")
+        sub.add_argument('--bases', nargs='+', choices=BASES, help="types d'établissement")
+        sub.add_argument('--zones', nargs='+', metavar='ZONE',
+                         help="france / regions / departments ou zones précises (de:75, re:11)")
+        sub.add_argument('--types', nargs='+', metavar='TYPE',
+                         help="tous_sejours, activite_medecine, categorie_chirurgie...")
+        sub.add_argument('--shard', type=parse_shard, metavar='i/N',
+                         help="ne traite que la tranche i sur N (partition déterministe, 1 <= i <= N)")
+        sub.add_argument('--limit', type=int, help="nombre maximum de combinaisons")
+
+    plan = subparsers.add_parser('plan', help="liste les combinaisons sélectionnées")
+    add_selection_arguments(plan)
+    plan.add_argument('--json', action='store_true', help="sortie JSON (une combinaison par ligne)")
+
+    scrape = subparsers.add_parser('scrape', help="scrape les combinaisons sélectionnées")
+    add_selection_arguments(scrape)
+    scrape.add_argument('--output-dir', default='donnees_scansante')
+    scrape.add_argument('--delay', type=float, default=2, help="pause entre requêtes (secondes)")
+    scrape.add_argument('--concurrency', type=int, default=1,
+                        help="requêtes simultanées (> 1 : client asynchrone, nécessite aiohttp)")
+    scrape.add_argument('--no-clean', action='store_true',
+                        help="ne pas lancer nettoyage et consolidation (runs shardés)")
+    scrape.add_argument('--fused', choices=['raw+clean', 'clean'],
+                        help="nettoyage en mémoire pendant le scraping (brut + nettoyé, ou nettoyé seul)")
+    scrape.add_argument('--consolidated-file', default='scansante_master_cleaned.csv')
+    scrape.add_argument('--time-budget', type=float, metavar='MINUTES',
+                        help="arrêt après N minutes (priorités critical puis high puis medium)")
+    scrape.add_argument('--request-budget', type=int, metavar='N', help="arrêt après N requêtes")
+
+    clean = subparsers.add_parser('clean', help="nettoie les CSV bruts")
+    clean.add_argument('--input-dir', default='donnees_scansante')
+    clean.add_argument('--output-dir', default='donnees_scansante_cleaned')
+
+    consolidate = subparsers.add_parser('consolidate', help="consolide les CSV nettoyés")
+    consolidate.add_argument('--input-dir', default='donnees_scansante_cleaned')
+    consolidate.add_argument('--output-file', default='scansante_master_cleaned.csv')
+
+    merge = subparsers.add_parser('merge', help="fusionne les sorties de plusieurs runs (shards)")
+    add_selection_arguments(merge)
+    merge.add_argument('trees', nargs='+', metavar='DOSSIER', help="arbres de sortie des runs à fusionner")
+    merge.add_argument('--output-dir', default='donnees_scansante', help="arbre fusionné")
+    merge.add_argument('--consolidated-file', default='scansante_master_cleaned.csv')
+
+    derive = subparsers.add_parser('derive', help="déduit les tableaux département/région des tableaux nationaux")
+    add_selection_arguments(derive)
+    derive.add_argument('--output-dir', default='donnees_scansante')
+    derive.add_argument('--levels', nargs='+', choices=['de', 're'], default=['de', 're'])
+    derive.add_argument('--verify', type=int, default=0, metavar='N',
+                        help="compare N départements tirés au hasard à de vrais scrapings tgeo='de'")
+
+    drill = subparsers.add_parser('drill', help="détail DA / GP / racine / GHM, élagué sous les parents vides")
+    add_selection_arguments(drill)
+    drill.add_argument('--output-dir', default='donnees_scansante')
+    drill.add_argument('--finess', nargs='+', metavar='FINESS',
+                       help="ne détaille que les regroupements où figurent ces établissements")
+    drill.add_argument('--depth', choices=DRILL_LEVELS, default='GHM', help="niveau le plus fin")
+    drill.add_argument('--mapping', default='ghm_hierarchy.json',
+                       help="rattachements GP -> DA et racine -> GP (JSON, optionnel)")
+    drill.add_argument('--delay', type=float, default=2, help="pause entre requêtes (secondes)")
+    drill.add_argument('--concurrency', type=int, default=1,
+                       help="requêtes simultanées (> 1 : client asynchrone, nécessite aiohttp)")
+
+    bench = subparsers.add_parser('bench', help="lance les benchmarks locaux")
+    bench.add_argument('names', nargs='*', help="benchmarks à lancer (défaut: tous)")
+
+    return parser
+
+
+def select_combinations(automation, args):
+    """Combinaisons correspondant aux options de sélection de la ligne de commande"""
+    if args.scope == 'complet':
+        combinations = automation.get_full_combinations()
+    else:
+        combinations = automation.get_strategic_combinations()
+
+    combinations = automation.filter_combinations(
+        combinations,
+        years=args.years,
+        bases=args.bases,
+        zones=args.zones,
+        types=args.types,
+        shard=args.shard
+    )
+    if args.limit:
+        combinations = combinations[:args.limit]
+    return combinations
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+
+    if args.command is None:
+        interactive_main(ScanSanteFinalAutomation())
+        return 0
+
+    if args.command == 'plan':
+        combinations = select_combinations(ScanSanteFinalAutomation(), args)
+        if args.json:
+            import json
+            for params in combinations:
+                print(json.dumps(params, ensure_ascii=False))
+        else:
+            for params in combinations:
+                print(f"{params['annee']} {params['tgeo']}:{params['codegeo']} {params['base']} "
+                      f"{combination_type(params)} ({params.get('priority', 'normal')})")
+            print(f"{len(combinations):,} combinaisons")
+        return 0
+
+    if args.command == 'scrape':
+        automation = ScanSanteFinalAutomation(output_dir=args.output_dir, fused=args.fused,
+                                              consolidated_file=args.consolidated_file)
+        combinations = select_combinations(automation, args)
+        successful_scrapes = automation.run_full_automation(
+            delay=args.delay,
+            combinations=combinations,
+            concurrency=args.concurrency,
+            clean=not args.no_clean,
+            time_budget=args.time_budget * 60 if args.time_budget else None,
+            request_budget=args.request_budget
+        )
+        print(f"{successful_scrapes:,} fichiers CSV crees avec succes dans {args.output_dir}")
+        return 0
+
+    if args.command in ('clean', 'consolidate'):
+        import data_cleaner
+
+        data_cleaner.setup_logging()
+        if args.command == 'clean':
+            data_cleaner.clean_all_csv_files(input_dir=args.input_dir, output_dir=args.output_dir)
+        else:
+            data_cleaner.create_consolidated_file(input_dir=args.input_dir, output_file=args.output_file)
+        return 0
+
+    if args.command == 'merge':
+        import shard_merge
+
+        automation = ScanSanteFinalAutomation(output_dir=args.output_dir)
+        automation.setup_logging()
+        summary = shard_merge.merge_trees(
+            args.trees,
+            args.output_dir,
+            planned=select_combinations(automation, args),
+            consolidated_file=args.consolidated_file
+        )
+        print(f"{summary['merged']:,} fichiers fusionnés ({summary['duplicates']} doublons, "
+              f"{summary['conflicts']} conflits dont {summary['unresolved']} non résolus), "
+              f"{summary['rows']:,} lignes consolidées")
+        if summary['missing']:
+            print(f"{len(summary['missing']):,} combinaisons planifiées manquantes")
+            return 1
+        return 0
+
+    if args.command == 'derive':
+        import geo_aggregates
+
+        automation = ScanSanteFinalAutomation(output_dir=args.output_dir)
+        automation.setup_logging()
+        args.zones = ['france']
+        national = [
+            params for params in select_combinations(automation, args)
+            if os.path.exists(os.path.join(automation.get_organized_filepath(params),
+                                           automation.generate_filename(params)))
+        ]
+        written = 0
+        for params in national:
+            written += len(geo_aggregates.derive_geographic_files(automation, params, levels=args.levels))
+        print(f"{written:,} tableaux géographiques déduits de {len(national)} tableaux nationaux")
+
+        if args.verify and national:
+            reports = geo_aggregates.verify_sample(automation, national[0], sample_size=args.verify)
+            failed = [code for code, report in reports.items() if not report['ok']]
+            print(f"Vérification: {len(reports) - len(failed)}/{len(reports)} départements conformes")
+            return 1 if failed else 0
+        return 0
+
+    if args.command == 'drill':
+        import ghm_drilldown
+
+        automation = ScanSanteFinalAutomation(output_dir=args.output_dir)
+        automation.setup_logging()
+        contexts = [params for params in select_combinations(automation, args) if params['typrgp'] == 'tous']
+        crawler = ghm_drilldown.DrillDownCrawler(
+            automation,
+            ghm_drilldown.GhmHierarchy.load(mapping_file=args.mapping),
+            finess=args.finess,
+            max_level=args.depth,
+            concurrency=args.concurrency,
+            delay=args.delay
+        )
+        stats = crawler.crawl(contexts)
+        print(f"{stats['requests']:,} requêtes ({stats['cached']:,} réponses réutilisées, "
+              f"{stats['pruned']:,} nœuds élagués sur {stats['full']:,}) pour {len(contexts)} contextes")
+        return 1 if stats['failed'] else 0
+
+    if args.command == 'bench':
+        import benchmark
+
+        benchmark.main(args.names)
+        return 0
+
+    return 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""
+Agrégats géographiques calculés localement à partir des tableaux nationaux
+
+Les tableaux France entière (tgeo='fe', codegeo='99') listent déjà chaque
+établissement avec son Finess, dont les premiers caractères codent le
+département. Les tableaux département (tgeo='de') et région (tgeo='re') se
+déduisent donc d'un filtrage du tableau national, sans requête :
+
+    Finess -> département -> région
+
+Les lignes sont reprises telles quelles (texte d'origine) et la ligne Total
+est recalculée (ratios pondérés comme ScanSante, voir CompactTable.stay_weights).
+Les tableaux déduits sont écrits dans un dossier à part (DERIVED_FOLDER, même
+hiérarchie que l'arbre scrapé) avec origin='derived' dans le manifeste : ils ne
+remplacent jamais un tableau réellement scrapé. verify_sample compare un échantillon de départements dérivés à de vrais
+scrapings tgeo='de'.
+"""
+
+import os
+import random
+
+import numpy as np
+
+# Départements -> régions (codes région utilisés par get_all_geographic_zones)
+REGION_DEPARTEMENTS = {
+    '84': ['01', '03', '07', '15', '26', '38', '42', '43', '63', '69', '73', '74'],  # AUVERGNE-RHÔNE-ALPES
+    '27': ['21', '25', '39', '58', '70', '71', '89', '90'],  # BOURGOGNE-FRANCHE-COMTÉ
+    '53': ['22', '29', '35', '56'],  # BRETAGNE
+    '24': ['18', '28', '36', '37', '41', '45'],  # CENTRE-VAL DE LOIRE
+    '94': ['2A', '2B'],  # CORSE
+    '44': ['08', '10', '51', '52', '54', '55', '57', '67', '68', '88'],  # GRAND EST
+    '01': ['971'],  # GUADELOUPE
+    '03': ['973'],  # GUYANE
+    '32': ['02', '59', '60', '62', '80'],  # HAUTS-DE-FRANCE
+    '11': ['75', '77', '78', '91', '92', '93', '94', '95'],  # ILE-DE-FRANCE
+    '04': ['974'],  # LA RÉUNION
+    '02': ['972'],  # MARTINIQUE
+    '06': ['976'],  # MAYOTTE
+    '28': ['14', '27', '50', '61', '76'],  # NORMANDIE
+    '75': ['16', '17', '19', '23', '24', '33', '40', '47', '64', '79', '86', '87'],  # NOUVELLE-AQUITAINE
+    '76': ['09', '11', '12', '30', '31', '32', '34', '46', '48', '65', '66', '81', '82'],  # OCCITANIE
+    '52': ['44', '49', '53', '72', '85'],  # PAYS DE LA LOIRE
+    '93': ['04', '05', '06', '13', '83', '84'],  # PROVENCE-ALPES-CÔTE D'AZUR
+}
+
+DEPARTEMENT_REGION = {
+    departement: region
+    for region, departements in REGION_DEPARTEMENTS.items()
+    for departement in departements
+}
+
+# Dossier des tableaux déduits (sous output_dir, même hiérarchie que l'arbre scrapé)
+DERIVED_FOLDER = "05_Agregats_deduits"
+
+# Préfixes Finess ne suivant pas la règle "2 premiers caractères"
+FINESS_PREFIX_DEPARTEMENT = {
+    '98': '976',  # Mayotte (Finess 98xxxxxxx)
+}
+
+
+def finess_departements(finess):
+    """Codes département (tableau de str) pour un tableau de Finess (S9 ou str), vectorisé"""
+    finess = np.asarray(finess).astype('U9')
+    departements = finess.astype('U2')
+
+    # Outre-mer : Finess 970Dxxxxx -> département 97D (9701 Guadeloupe -> 971, ...,
+    # 9704 Réunion -> 974) ; 975 (Saint-Pierre-et-Miquelon) n'a pas de région
+    overseas = departements == '97'
+    departements = departements.astype('U3')
+    departements[overseas] = ['97' + f[3:4] for f in finess[overseas]]
+    for prefix, departement in FINESS_PREFIX_DEPARTEMENT.items():
+        departements[departements == prefix] = departement
+    return departements
+
+
+def zone_codes(table, level):
+    """Code de zone de chaque ligne : département ('de') ou région ('re'), '' si inconnu"""
+    departements = finess_departements(table.columns_of_kind('finess')[0].values)
+    if level == 'de':
+        return departements
+    unique, inverse = np.unique(departements, return_inverse=True)
+    regions = np.array([DEPARTEMENT_REGION.get(d, '') for d in unique], dtype='U3')
+    return regions[inverse]
+
+
+def derive_tables(table, level='de'):
+    """Découpe un tableau national en tableaux par zone : {code: CompactTable}
+
+    Regroupement vectorisé (tri stable sur le code de zone) ; l'ordre des
+    lignes du tableau national est conservé dans chaque zone.
+    """
+    codes = zone_codes(table, level)
+    order = np.argsort(codes, kind='stable')
+    sorted_codes = codes[order]
+    boundaries = np.flatnonzero(sorted_codes[1:] != sorted_codes[:-1]) + 1
+
+    derived = {}
+    for indices in np.split(order, boundaries):
+        if not len(indices):
+            continue
+        code = str(codes[indices[0]])
+        if not code:
+            continue
+        derived[code] = table.take(indices, total=table.total_row(indices))
+    return derived
+
+
+def derived_params(national_params, level, code):
+    """Paramètres de la combinaison équivalente pour une zone"""
+    return dict(national_params, tgeo=level, codegeo=code, priority='derived')
+
+
+def derived_filepath(automation, params):
+    """Chemin du tableau déduit : hiérarchie de get_organized_filepath sous DERIVED_FOLDER"""
+    organized = os.path.relpath(automation.get_organized_filepath(params), automation.output_dir)
+    return os.path.join(automation.output_dir, DERIVED_FOLDER, organized,
+                        automation.generate_filename(params))
+
+
+def derivable(automation, params, zones, manifest):
+    """Vrai si la combinaison peut être déduite sans masquer une donnée scrapée
+
+    La zone doit faire partie des zones planifiées, la combinaison passer
+    validate_combination, et aucun fichier ni entrée de manifeste scrapés ne
+    doit déjà exister pour elle.
+    """
+    from final_automation import combination_key
+
+    if (params['tgeo'], params['codegeo']) not in zones:
+        return False
+    if not automation.validate_combination(params):
+        return False
+    scraped_path = os.path.join(automation.get_organized_filepath(params), automation.generate_filename(params))
+    if os.path.exists(scraped_path):
+        return False
+    entry = manifest.get(combination_key(params))
+    return entry is None or entry.get('origin') == 'derived'
+
+
+def derive_geographic_files(automation, national_params, levels=('de', 're')):
+    """Écrit les tableaux département / région déduits d'un fichier national
+
+    Les combinaisons déjà scrapées ou refusées par validate_combination sont
+    ignorées. Retourne la liste des chemins écrits (relatifs à automation.output_dir).
+    """
+    import shard_merge
+    from compact_table import CompactTable
+
+    national_path = os.path.join(automation.get_organized_filepath(national_params),
+                                 automation.generate_filename(national_params))
+    table = CompactTable.read_csv(national_path)
+
+    zones = {zone for group in automation.get_all_geographic_zones().values() for zone in group}
+    manifest = shard_merge.load_manifest(automation.output_dir)
+
+    written = []
+    skipped = 0
+    for level in levels:
+        for code, zone_table in derive_tables(table, level).items():
+            params = derived_params(national_params, level, code)
+            if not derivable(automation, params, zones, manifest):
+                skipped += 1
+                continue
+            filepath = derived_filepath(automation, params)
+            os.makedirs(os.path.dirname(filepath), exist_ok=True)
+            sha256 = zone_table.write_csv(filepath)
+
+            relative_path = os.path.relpath(filepath, automation.output_dir).replace(os.sep, '/')
+            automation.record_manifest(params, "ok", path=relative_path, rows=len(zone_table),
+                                       sha256=sha256, origin='derived')
+            written.append(relative_path)
+
+    automation.logger.info(f"{len(written)} tableaux géographiques déduits de "
+                           f"{os.path.relpath(national_path, automation.output_dir)} "
+                           f"({skipped} ignorés : déjà scrapés, zone inconnue ou combinaison invalide)")
+    return written
+
+
+def compare_tables(derived, scraped, tolerance=0.05):
+    """Compare un tableau dérivé à un tableau réellement scrapé pour la même zone"""
+    def by_finess(table):
+        column = table.columns_of_kind('finess')[0]
+        return {value.decode('ascii'): i for i, value in enumerate(column.values)}
+
+    derived_index, scraped_index = by_finess(derived), by_finess(scraped)
+    common = sorted(set(derived_index) & set(scraped_index))
+
+    count_mismatches = 0
+    for derived_column, scraped_column in zip(derived.columns_of_kind('count'), scraped.columns_of_kind('count')):
+        d = derived_column.values[[derived_index[f] for f in common]]
+        s = scraped_column.values[[scraped_index[f] for f in common]]
+        count_mismatches += int((d != s).sum())
+
+    derived_ratios, scraped_ratios = derived.weighted_ratios(), scraped.weighted_ratios()
+    ratio_gaps = {
+        header: abs(derived_ratios[header] - scraped_ratios.get(header, np.nan))
+        for header in derived_ratios
+    }
+
+    return {
+        'missing': sorted(set(scraped_index) - set(derived_index)),
+        'extra': sorted(set(derived_index) - set(scraped_index)),
+        'count_mismatches': count_mismatches,
+        'ratio_gaps': ratio_gaps,
+        'ok': (set(derived_index) == set(scraped_index) and count_mismatches == 0
+               and all(gap <= tolerance for gap in ratio_gaps.values() if not np.isnan(gap)))
+    }
+
+
+def verify_sample(automation, national_params, sample_size=3, seed=None):
+    """Scrape un échantillon de départements (tgeo='de') et les compare aux tableaux dérivés
+
+    Retourne {code département: rapport de compare_tables}.
+    """
+    from compact_table import CompactTable
+
+    national_path = os.path.join(automation.get_organized_filepath(national_params),
+                                 automation.generate_filename(national_params))
+    derived = derive_tables(CompactTable.read_csv(national_path), 'de')
+
+    candidates = sorted(code for code in derived if code in DEPARTEMENT_REGION)
+    sample = random.Random(seed).sample(candidates, min(sample_size, len(candidates)))
+
+    reports = {}
+    for code in sample:
+        headers, rows = automation.fetch_table(derived_params(national_params, 'de', code))
+        if not headers or not rows:
+            automation.logger.warning(f"Vérification dept {code}: tableau réel indisponible")
+            continue
+        report = compare_tables(derived[code], CompactTable.from_rows(headers, rows))
+        reports[code] = report
+        status = "OK" if report['ok'] else "ÉCART"
+        automation.logger.info(
+            f"Vérification dept {code}: {status} - {len(report['missing'])} manquants, "
+            f"{len(report['extra'])} en trop, {report['count_mismatches']} comptages différents"
+        )
+    return reports
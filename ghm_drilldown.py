@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+"""
+Exploration élaguée des "Autres regroupements de GHM"
+
+Hiérarchie (du plus large au plus fin) :
+
+    Domaine d'activité (DA) -> Groupe planification (GP) -> Racine -> GHM
+
+Le crawler descend niveau par niveau (parcours en largeur) et n'interroge les
+enfants que d'un parent non vide : un DA sans séjour élimine d'un coup ses GP,
+racines et GHM. Avec un filtre Finess, seuls les parents où figure au moins
+un des établissements suivis sont détaillés.
+
+Les réponses déjà obtenues sont réutilisées : manifeste de l'arbre de sortie
+(runs précédents, statut "empty" compris) puis cache du process. Les tableaux
+sont écrits au même endroit que le scraping normal
+(<zone>/<base>/4_Regroupements_GHM/{1_DA,2_GP,3_Racines,4_GHM}/).
+
+Rattachements : GHM -> racine se lit dans le code (5 premiers caractères).
+Racine -> GP et GP -> DA ne sont pas déductibles des codes ; ils viennent d'un
+fichier JSON optionnel {"GP": {"C01": "D25", ...}, "racine": {"27C02": "C01", ...}}.
+Un nœud sans parent connu est interrogé sans élagage (rattaché à la racine).
+Sans ce fichier, DA et GP n'ont aucun enfant connu et ne peuvent rien élaguer :
+ces niveaux ne sont pas interrogés (sauf s'ils sont le niveau le plus fin
+demandé) et un avertissement signale que l'élagage y est désactivé.
+"""
+
+import json
+import logging
+import os
+import re
+import time
+
+from final_automation import DRILL_LEVELS, combination_key, manifest_entry_file
+
+logger = logging.getLogger(__name__)
+
+NOMENCLATURE_FILE = "Aborescence des filtres.md"
+MAPPING_FILE = "ghm_hierarchy.json"
+
+# Titres de section de la nomenclature -> niveau
+SECTION_TITLES = [
+    (re.compile(r"Domaine d'activit"), 'DA'),
+    (re.compile(r"Groupe planification"), 'GP'),
+    (re.compile(r"Racine de GHM"), 'racine'),
+    (re.compile(r"^\W*GHM\W*$"), 'GHM'),
+]
+CODE_PATTERN = re.compile(r'^([0-9A-Z]{2,6}) - (.+)$')
+
+# Statuts du manifeste indiquant un tableau non vide
+NON_EMPTY_STATUSES = ('ok', 'minimal', 'mismatch')
+
+
+def load_nomenclature(path=NOMENCLATURE_FILE):
+    """Codes des quatre niveaux : {niveau: {code: libellé}} (ordre du fichier)"""
+    nomenclature = {level: {} for level in DRILL_LEVELS}
+    level = None
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith('**'):
+                level = next((lvl for pattern, lvl in SECTION_TITLES if pattern.search(line)), None)
+                continue
+            match = CODE_PATTERN.match(line) if level else None
+            if match:
+                nomenclature[level][match.group(1)] = match.group(2).strip()
+    return nomenclature
+
+
+def load_mapping(path=MAPPING_FILE):
+    """Rattachements GP -> DA et racine -> GP (fichier optionnel) ; {} s'il est absent"""
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+class GhmHierarchy:
+    """Arbre DA / GP / racine / GHM ; nœud = (niveau, code)"""
+
+    def __init__(self, nomenclature, mapping=None):
+        mapping = mapping or {}
+        self.nomenclature = nomenclature
+        self.parents = {}
+        self.children = {}
+        for depth, level in enumerate(DRILL_LEVELS[1:], start=1):
+            parent_level = DRILL_LEVELS[depth - 1]
+            known = nomenclature.get(parent_level, {})
+            for code in nomenclature.get(level, {}):
+                if level == 'GHM':
+                    parent = code[:5]
+                else:
+                    parent = mapping.get(level, {}).get(code)
+                if parent in known:
+                    self.parents[(level, code)] = (parent_level, parent)
+                    self.children.setdefault((parent_level, parent), []).append((level, code))
+
+    @classmethod
+    def load(cls, nomenclature_file=NOMENCLATURE_FILE, mapping_file=MAPPING_FILE):
+        return cls(load_nomenclature(nomenclature_file), load_mapping(mapping_file))
+
+    def roots(self, level):
+        """Nœuds d'un niveau sans parent connu (toujours interrogés)"""
+        return [(level, code) for code in self.nomenclature.get(level, {}) if (level, code) not in self.parents]
+
+    def linked(self, level):
+        """Vrai si au moins un nœud du niveau a un enfant connu (le niveau peut élaguer)"""
+        return any(node[0] == level for node in self.children)
+
+    def prunable_levels(self, levels):
+        """Niveaux à interroger parmi levels (consécutifs, du plus large au plus fin)
+
+        Le plus fin est toujours gardé ; un niveau plus large ne l'est que s'il
+        est rattaché au niveau suivant, lui-même gardé.
+        """
+        kept = [levels[-1]]
+        for level in reversed(levels[:-1]):
+            if not self.linked(level):
+                break
+            kept.insert(0, level)
+        return kept
+
+    def size(self, max_level='GHM'):
+        levels = DRILL_LEVELS[:DRILL_LEVELS.index(max_level) + 1]
+        return sum(len(self.nomenclature.get(level, {})) for level in levels)
+
+
+def drill_params(context, node):
+    """Combinaison /submit d'un nœud dans un contexte (année, zone, base)"""
+    level, code = node
+    params = {
+        'annee': context['annee'],
+        'tgeo': context['tgeo'],
+        'codegeo': context['codegeo'],
+        'base': context['base'],
+        'typrgp': 'rgpGHM',
+        'ASO': '',
+        'CAS': '',
+        'priority': context.get('priority', 'medium'),
+    }
+    params[level] = code
+    return params
+
+
+class DrillDownCrawler:
+    """Parcours en largeur de la hiérarchie, élagué sous les parents vides
+
+    automation : ScanSanteFinalAutomation (session, écriture, manifeste)
+    finess : Finess suivis ; un parent n'est détaillé que s'il en contient un
+    max_level : niveau le plus fin à atteindre ('DA', 'GP', 'racine' ou 'GHM')
+    concurrency : > 1 pour le client asynchrone (scrape_many)
+    """
+
+    def __init__(self, automation, hierarchy, finess=None, max_level='GHM', concurrency=1, delay=2):
+        import shard_merge
+
+        self.automation = automation
+        self.hierarchy = hierarchy
+        self.finess = {f.strip().zfill(9) for f in finess} if finess else None
+        requested = DRILL_LEVELS[:DRILL_LEVELS.index(max_level) + 1]
+        self.levels = hierarchy.prunable_levels(requested)
+        skipped = requested[:len(requested) - len(self.levels)]
+        if skipped:
+            logger.warning(f"Élagage désactivé pour {', '.join(skipped)}: rattachements absents "
+                           f"({MAPPING_FILE}), niveaux non interrogés ; "
+                           f"{len(hierarchy.roots(self.levels[0])):,} nœuds {self.levels[0]} "
+                           f"interrogés sans élagage par contexte")
+        self.concurrency = concurrency
+        self.delay = delay
+        self.known = shard_merge.load_manifest(automation.output_dir)
+        self.cache = {}
+        self.stats = {'requests': 0, 'cached': 0, 'pruned': 0, 'non_empty': 0, 'failed': 0}
+
+    def _cached(self, params):
+        """Statut connu d'une combinaison ('empty', 'ok'...) ou None s'il faut l'interroger"""
+        key = combination_key(params)
+        if key in self.cache:
+            return self.cache[key]
+        entry = self.known.get(key)
+        if entry is None:
+            return None
+        if entry['status'] == 'empty':
+            return 'empty'
+        if entry['status'] in NON_EMPTY_STATUSES:
+            path = manifest_entry_file(self.automation.output_dir, entry)
+            if path is None or os.path.exists(path):
+                return entry['status']
+        return None
+
+    def _fetch(self, batch):
+        """Interroge les combinaisons non cachées ; {clé: statut}"""
+        if not batch:
+            return {}
+        self.stats['requests'] += len(batch)
+        if self.concurrency > 1:
+            results = self.automation.scrape_many(batch, concurrency=self.concurrency)
+        else:
+            results = []
+            for i, params in enumerate(batch):
+                results.append(self.automation.scrape_table_data(params))
+                if i < len(batch) - 1:
+                    time.sleep(self.delay)
+
+        statuses = {}
+        for params, result in zip(batch, results):
+            statuses[combination_key(params)] = 'ok' if result is True else (result or 'failed')
+        return statuses
+
+    def _contains_target(self, params):
+        """Le tableau d'un nœud contient-il un des Finess suivis ? (vrai sans filtre)"""
+        if self.finess is None:
+            return True
+        from compact_table import CompactTable
+
+        path = os.path.join(self.automation.get_organized_filepath(params),
+                            self.automation.generate_filename(params))
+        if not os.path.exists(path):
+            # Tableau "minimal" (non écrit) : on descend par prudence
+            return True
+        table = CompactTable.read_csv(path)
+        for column in table.columns_of_kind('finess'):
+            if self.finess.intersection(column.cleaned_values().tolist()):
+                return True
+        return False
+
+    def crawl_context(self, context):
+        """Explore la hiérarchie pour un contexte ; retourne les nœuds non vides retenus"""
+        expanded = []
+        for depth, level in enumerate(self.levels):
+            nodes = self.hierarchy.roots(level)
+            if depth:
+                nodes += [child for parent in expanded if parent[0] == self.levels[depth - 1]
+                          for child in self.hierarchy.children.get(parent, [])]
+            if not nodes:
+                continue
+
+            batch, statuses = [], {}
+            for node in nodes:
+                params = drill_params(context, node)
+                status = self._cached(params)
+                if status is None:
+                    batch.append(params)
+                else:
+                    self.stats['cached'] += 1
+                    statuses[combination_key(params)] = status
+            statuses.update(self._fetch(batch))
+            self.cache.update(statuses)
+
+            kept = []
+            for node in nodes:
+                params = drill_params(context, node)
+                status = statuses[combination_key(params)]
+                if status == 'failed':
+                    self.stats['failed'] += 1
+                    continue
+                descend = status in NON_EMPTY_STATUSES and self._contains_target(params)
+                if status in NON_EMPTY_STATUSES:
+                    self.stats['non_empty'] += 1
+                if descend:
+                    kept.append(node)
+                elif depth < len(self.levels) - 1:
+                    self.stats['pruned'] += self._pruned_below(node)
+            logger.info(f"Drill-down {context['annee']} {context['tgeo']}:{context['codegeo']} {context['base']} "
+                        f"{level}: {len(nodes)} nœuds, {len(batch)} requêtes, {len(kept)} détaillés")
+            expanded = kept
+        return expanded
+
+    def _pruned_below(self, node):
+        """Nombre de requêtes évitées sous un nœud (jusqu'au niveau le plus fin demandé)"""
+        last = DRILL_LEVELS.index(self.levels[-1])
+        count, frontier = 0, [node]
+        while frontier:
+            children = [child for parent in frontier for child in self.hierarchy.children.get(parent, [])
+                        if DRILL_LEVELS.index(child[0]) <= last]
+            count += len(children)
+            frontier = children
+        return count
+
+    def crawl(self, contexts):
+        """Explore chaque contexte (combinaisons 'tous séjours') ; retourne les statistiques"""
+        self.automation.setup_logging()
+        for context in contexts:
+            self.crawl_context(context)
+        full = self.hierarchy.size(self.levels[-1]) * len(contexts)
+        logger.info(f"Drill-down terminé: {self.stats['requests']} requêtes, {self.stats['cached']} réponses "
+                    f"réutilisées, {self.stats['pruned']} nœuds élagués (espace complet: {full:,})")
+        return dict(self.stats, full=full)
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+État de la collecte partagé entre processus (SQLite)
+
+Avec plusieurs workers WSGI, chaque processus a sa propre mémoire : un dict
+global ne voit ni la collecte lancée par un autre worker, ni sa progression.
+L'état (compteurs, progression, arrêt demandé) et les derniers logs sont donc
+stockés dans un petit fichier SQLite en mode WAL : les lectures de /api/status
+ne bloquent pas les écritures du thread de collecte.
+
+    state = JobStateStore('scansante_state.db')
+    if state.try_start(total_files=250):      # atomique entre workers
+        ...
+        state.increment('successful')
+    state.snapshot()                          # dict de l'état courant
+
+La collecte tourne dans un thread du worker qui a reçu /api/start ; son PID
+est enregistré pour détecter un worker mort pendant une collecte.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+DEFAULT_STATE = {
+    'is_running': False,
+    'stop_requested': False,
+    'progress': 0,
+    'current_file': '',
+    'total_files': 0,
+    'successful': 0,
+    'failed': 0,
+    'start_time': None,
+    'end_time': None,
+    'worker_pid': None,
+}
+MAX_LOGS = 100
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobStateStore:
+    def __init__(self, path="scansante_state.db", max_logs=MAX_LOGS):
+        """Aucun accès disque ici : le fichier et ses tables sont créés à la première utilisation"""
+        self.path = path
+        self.max_logs = max_logs
+        self._local = threading.local()
+
+    @property
+    def db(self):
+        """Connexion SQLite du thread courant (autocommit, transactions explicites)"""
+        db = getattr(self._local, 'db', None)
+        if db is None or getattr(self._local, 'pid', None) != os.getpid():
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            _create_tables(db)
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return db
+
+    def _transaction(self):
+        return _Transaction(self.db)
+
+    def snapshot(self):
+        """État courant ; une collecte dont le worker a disparu est marquée arrêtée"""
+        state = {key: json.loads(value) for key, value in self.db.execute("SELECT key, value FROM state")}
+        if state.get('is_running') and state.get('worker_pid') and not pid_alive(state['worker_pid']):
+            state.update(is_running=False, end_time=datetime.now().isoformat(timespec='seconds'))
+            self.update(is_running=False, end_time=state['end_time'])
+        return state
+
+    def get(self, key):
+        row = self.db.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else DEFAULT_STATE.get(key)
+
+    def update(self, **fields):
+        with self._transaction() as db:
+            db.executemany("INSERT OR REPLACE INTO state VALUES (?, ?)",
+                           [(key, json.dumps(value)) for key, value in fields.items()])
+
+    def increment(self, key, amount=1):
+        """Incrémente un compteur ; retourne sa nouvelle valeur"""
+        with self._transaction() as db:
+            row = db.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+            value = (json.loads(row[0]) if row else 0) + amount
+            db.execute("INSERT OR REPLACE INTO state VALUES (?, ?)", (key, json.dumps(value)))
+        return value
+
+    def try_start(self, **fields):
+        """Passe l'état à "en cours" si aucune collecte ne tourne (atomique entre workers)
+
+        Les compteurs sont remis à zéro puis fields appliqués. Retourne False si
+        une collecte est déjà en cours.
+        """
+        if self.snapshot().get('is_running'):
+            return False
+        with self._transaction() as db:
+            row = db.execute("SELECT value FROM state WHERE key = 'is_running'").fetchone()
+            if row and json.loads(row[0]):
+                return False
+            values = dict(DEFAULT_STATE, is_running=True, worker_pid=os.getpid(),
+                          start_time=datetime.now().isoformat(timespec='seconds'), **fields)
+            db.executemany("INSERT OR REPLACE INTO state VALUES (?, ?)",
+                           [(key, json.dumps(value)) for key, value in values.items()])
+            db.execute("DELETE FROM logs")
+        return True
+
+    def reset(self):
+        with self._transaction() as db:
+            db.executemany("INSERT OR REPLACE INTO state VALUES (?, ?)",
+                           [(key, json.dumps(value)) for key, value in DEFAULT_STATE.items()])
+            db.execute("DELETE FROM logs")
+
+    def append_log(self, level, message, time=None):
+        """Ajoute un log affiché par l'interface ; seuls les max_logs derniers sont gardés"""
+        time = time or datetime.now().strftime('%H:%M:%S')
+        with self._transaction() as db:
+            log_id = db.execute("INSERT INTO logs (time, level, message) VALUES (?, ?, ?)",
+                                (time, level, message)).lastrowid
+            db.execute("DELETE FROM logs WHERE id <= ?", (log_id - self.max_logs,))
+
+    def recent_logs(self, limit=20):
+        rows = self.db.execute("SELECT time, level, message FROM logs ORDER BY id DESC LIMIT ?",
+                               (limit,)).fetchall()
+        return [{'time': t, 'level': level, 'message': message} for t, level, message in reversed(rows)]
+
+
+def _create_tables(db):
+    """Tables et état par défaut (idempotent : une fois par nouvelle connexion)"""
+    with _Transaction(db):
+        db.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT)")
+        db.execute("CREATE TABLE IF NOT EXISTS logs (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                   "time TEXT, level TEXT, message TEXT)")
+        db.executemany("INSERT OR IGNORE INTO state VALUES (?, ?)",
+                       [(key, json.dumps(value)) for key, value in DEFAULT_STATE.items()])
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT (ROLLBACK en cas d'exception)"""
+
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute("BEGIN IMMEDIATE")
+        return self.db
+
+    def __exit__(self, exc_type, exc, tb):
+        self.db.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test de charge local du tableau de bord
+
+Des clients concurrents (une session HTTP keep-alive chacun) interrogent en
+boucle /api/status, /api/files et /api/download ; le script affiche les
+latences p50 / p99 / max et le débit par endpoint. Seules les réponses 2xx
+entrent dans les latences : les autres (404 sans fichier consolidé, 5xx,
+erreurs réseau) sont comptées en erreurs, avec leurs codes.
+
+Usage :
+    python wsgi.py --workers 4 --threads 8 &
+    python load_test.py --clients 32 --duration 20
+    python load_test.py --url http://127.0.0.1:5000 --endpoints status files
+"""
+
+import argparse
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+ENDPOINTS = {
+    'status': '/api/status',
+    'files': '/api/files',
+    'download': '/api/download',
+}
+
+
+def percentile(sorted_values, fraction):
+    """Percentile par rang le plus proche d'une liste triée"""
+    if not sorted_values:
+        return float('nan')
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def run_client(url, paths, deadline, results, lock):
+    """Un client : parcourt les endpoints en boucle jusqu'à deadline"""
+    import requests
+
+    session = requests.Session()
+    latencies = {name: [] for name in paths}
+    errors = {name: Counter() for name in paths}
+    sizes = {name: 0 for name in paths}
+    i = 0
+    while time.perf_counter() < deadline:
+        name = list(paths)[i % len(paths)]
+        i += 1
+        start = time.perf_counter()
+        try:
+            with session.get(url + paths[name], stream=True, timeout=60) as response:
+                size = sum(len(chunk) for chunk in response.iter_content(64 * 1024))
+            status = response.status_code
+        except Exception as e:
+            status, size = type(e).__name__, 0
+        elapsed = time.perf_counter() - start
+        if isinstance(status, int) and 200 <= status < 300:
+            latencies[name].append(elapsed)
+            sizes[name] += size
+        else:
+            errors[name][status] += 1
+
+    with lock:
+        for name in paths:
+            results[name]['latencies'].extend(latencies[name])
+            results[name]['errors'].update(errors[name])
+            results[name]['bytes'] += sizes[name]
+
+
+def load_test(url, clients=16, duration=10, endpoints=None):
+    """Lance clients clients pendant duration secondes ; retourne {endpoint: statistiques}"""
+    paths = {name: ENDPOINTS[name] for name in (endpoints or ENDPOINTS)}
+    results = {name: {'latencies': [], 'errors': Counter(), 'bytes': 0} for name in paths}
+    lock = threading.Lock()
+
+    deadline = time.perf_counter() + duration
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        for _ in range(clients):
+            executor.submit(run_client, url.rstrip('/'), paths, deadline, results, lock)
+
+    report = {}
+    for name, result in results.items():
+        latencies = sorted(result['latencies'])
+        report[name] = {
+            'requests': len(latencies),
+            'errors': sum(result['errors'].values()),
+            'error_codes': dict(result['errors']),
+            'p50_ms': percentile(latencies, 0.50) * 1000,
+            'p99_ms': percentile(latencies, 0.99) * 1000,
+            'max_ms': (latencies[-1] if latencies else float('nan')) * 1000,
+            'req_per_s': len(latencies) / duration,
+            'mb_per_s': result['bytes'] / duration / 1e6,
+        }
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Test de charge du tableau de bord ScanSante")
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--clients', type=int, default=16, help="clients concurrents")
+    parser.add_argument('--duration', type=float, default=10, help="durée (secondes)")
+    parser.add_argument('--endpoints', nargs='+', choices=list(ENDPOINTS), help="défaut: tous")
+    args = parser.parse_args(argv)
+
+    report = load_test(args.url, clients=args.clients, duration=args.duration, endpoints=args.endpoints)
+    print(f"=== Charge : {args.clients} clients, {args.duration:g} s sur {args.url} ===")
+    print(f"{'endpoint':<10} {'requêtes':>9} {'erreurs':>8} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} "
+          f"{'req/s':>8} {'Mo/s':>7}")
+    for name, stats in report.items():
+        print(f"{name:<10} {stats['requests']:>9,} {stats['errors']:>8} {stats['p50_ms']:>8.1f} "
+              f"{stats['p99_ms']:>8.1f} {stats['max_ms']:>8.1f} {stats['req_per_s']:>8.1f} "
+              f"{stats['mb_per_s']:>7.1f}")
+    for name, stats in report.items():
+        if stats['error_codes']:
+            codes = ', '.join(f"{code}: {count:,}" for code, count in stats['error_codes'].items())
+            print(f"{name}: réponses hors 2xx exclues des latences ({codes})")
+    return 1 if any(stats['errors'] for stats in report.values()) else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
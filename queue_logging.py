@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+Logging non bloquant : QueueHandler côté threads de scraping, QueueListener
+dans un thread dédié pour les écritures (fichier avec rotation, console,
+interface web).
+
+Sur un thread de scraping, un enregistrement de log coûte une mise en file ;
+le formatage JSON, les verrous des handlers et les écritures disque sont
+faits par le thread du listener.
+
+Le fichier de log garde le format texte ; les enregistrements JSON vont dans
+un fichier à part (même nom, extension .jsonl), un objet par ligne :
+    {"time": "...", "level": "INFO", "logger": "final_automation",
+     "thread": "scansante-parse_0", "message": "..."}
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+from datetime import datetime
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# Attributs standard d'un LogRecord (le reste vient de extra={...})
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+_listener = None
+_queue_handler = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Un objet JSON par enregistrement, champs extra={...} inclus"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and key not in entry:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class EnqueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler allégé : message résolu et mis en file, sans copie ni formatage complet"""
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def json_log_file(log_file):
+    """Fichier des enregistrements JSON associé à un fichier de log (scansante_final.log -> .jsonl)"""
+    return os.path.splitext(log_file)[0] + '.jsonl'
+
+
+def start_queue_logging(log_file, max_bytes=10 * 1024 * 1024, backup_count=5,
+                        json_records=True, console=True, level=logging.INFO):
+    """Installe QueueHandler (logger racine) + QueueListener ; idempotent
+
+    log_file : fichier de log (format texte), rotation à max_bytes avec backup_count archives
+    json_records : enregistrements JSON en plus, dans json_log_file(log_file) (même rotation)
+    console : recopie les logs sur la sortie d'erreur (format texte)
+    Retourne le QueueListener.
+    """
+    global _listener, _queue_handler
+    if _listener is not None:
+        return _listener
+
+    outputs = [(log_file, logging.Formatter(TEXT_FORMAT))]
+    if json_records:
+        # Fichier à part : une ligne sur deux en JSON rendrait les deux formats inexploitables
+        outputs.append((json_log_file(log_file), JsonFormatter()))
+
+    handlers = []
+    for path, formatter in outputs:
+        file_handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8'
+        )
+        file_handler.setFormatter(formatter)
+        handlers.append(file_handler)
+    if console:
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+        handlers.append(console_handler)
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.setLevel(level)
+    _queue_handler = EnqueueHandler(log_queue)
+    root.addHandler(_queue_handler)
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_queue_logging)
+    return _listener
+
+
+def add_listener_handler(handler):
+    """Ajoute un handler côté listener (ex. interface web), hors des threads de scraping"""
+    if _listener is None:
+        logging.getLogger().addHandler(handler)
+        return
+    if handler in _listener.handlers:
+        return
+    _listener.stop()
+    _listener.handlers = _listener.handlers + (handler,)
+    _listener.start()
+
+
+def stop_queue_logging():
+    """Vide la file et arrête le listener (appelé automatiquement en fin de process)"""
+    global _listener, _queue_handler
+    if _listener is None:
+        return
+    logging.getLogger().removeHandler(_queue_handler)
+    _queue_handler = None
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = None
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+Ordonnanceur des combinaisons selon leur champ 'priority'
+
+- une file par niveau de priorité (critical > high > medium > autres) ;
+- à l'intérieur d'un niveau, alternance équitable entre les années
+  (2024, 2023, ..., 2015, 2024, ...) pour ne pas épuiser le budget sur
+  une seule année ;
+- budget optionnel en temps (secondes) et/ou en nombre de requêtes ;
+- une combinaison en échec est remise dans la file de son niveau : un échec
+  critical/high repasse donc avant toute combinaison medium.
+
+Utilisation :
+    scheduler = PriorityScheduler(combinations, time_budget=30 * 60)
+    for params in scheduler:
+        result = automation.scrape_table_data(params)
+        scheduler.record(params, result)
+"""
+
+import time
+from collections import deque
+
+from final_automation import combination_key
+
+PRIORITY_LEVELS = ['critical', 'high', 'medium']
+# Résultats de scrape_table_data à retenter : échec technique seulement. Un écart à
+# la ligne Total ('mismatch') est déjà retéléchargé aussitôt par scrape_table_data,
+# puis écrit : le remettre en file le retéléchargerait (et le réécrirait) encore
+FAILED_RESULTS = (False,)
+DEFAULT_LEVEL = len(PRIORITY_LEVELS)
+
+
+def priority_level(params):
+    """Rang de priorité d'une combinaison (0 = critical) ; inconnu -> après medium"""
+    priority = params.get('priority')
+    return PRIORITY_LEVELS.index(priority) if priority in PRIORITY_LEVELS else DEFAULT_LEVEL
+
+
+class _YearRoundRobin:
+    """File d'un niveau de priorité : une sous-file par année, servies à tour de rôle"""
+
+    def __init__(self):
+        self.queues = {}
+        self.turns = deque()
+
+    def push(self, params):
+        year = params.get('annee')
+        if year not in self.queues:
+            self.queues[year] = deque()
+            self.turns.append(year)
+        self.queues[year].append(params)
+
+    def pop(self):
+        if self.turns:
+            year = self.turns.popleft()
+            queue = self.queues[year]
+            params = queue.popleft()
+            if queue:
+                self.turns.append(year)
+            else:
+                del self.queues[year]
+            return params
+        return None
+
+    def __len__(self):
+        return sum(len(queue) for queue in self.queues.values())
+
+
+class PriorityScheduler:
+    def __init__(self, combinations, time_budget=None, request_budget=None,
+                 max_retries=2, retry_levels=('critical', 'high'), should_stop=None, clock=time.monotonic):
+        """
+        combinations : combinaisons à planifier (l'ordre d'entrée est conservé par année)
+        time_budget : durée maximale en secondes (None = illimitée), comptée au premier appel
+        request_budget : nombre maximal de requêtes lancées (None = illimité), tentatives comprises
+        max_retries : nombre de nouvelles tentatives par combinaison en échec
+        retry_levels : niveaux de priorité dont les échecs sont remis en file
+        should_stop : fonction sans argument, arrêt anticipé si elle retourne True
+        """
+        self.time_budget = time_budget
+        self.request_budget = request_budget
+        self.max_retries = max_retries
+        self.retry_levels = set(PRIORITY_LEVELS.index(level) for level in retry_levels)
+        self.should_stop = should_stop
+        self.clock = clock
+
+        self.levels = [_YearRoundRobin() for _ in range(DEFAULT_LEVEL + 1)]
+        for params in combinations:
+            self.push(params)
+
+        self.attempts = {}
+        self.requests = 0
+        self.retries = 0
+        self.started_at = None
+        self.stop_reason = None
+
+    def push(self, params):
+        self.levels[priority_level(params)].push(params)
+
+    def __len__(self):
+        return sum(len(level) for level in self.levels)
+
+    def budget_exhausted(self):
+        """Raison de l'arrêt si un budget est épuisé (ou un arrêt demandé), sinon None"""
+        if self.should_stop and self.should_stop():
+            return "arrêt demandé"
+        if self.request_budget is not None and self.requests >= self.request_budget:
+            return "budget de requêtes atteint"
+        if (self.time_budget is not None and self.started_at is not None
+                and self.clock() - self.started_at >= self.time_budget):
+            return "budget de temps atteint"
+        return None
+
+    def next(self):
+        """Prochaine combinaison à traiter, ou None (file vide ou budget épuisé)"""
+        if self.started_at is None:
+            self.started_at = self.clock()
+
+        self.stop_reason = self.budget_exhausted()
+        if self.stop_reason:
+            return None
+
+        for level in self.levels:
+            params = level.pop()
+            if params is not None:
+                self.requests += 1
+                return params
+        return None
+
+    def __iter__(self):
+        while True:
+            params = self.next()
+            if params is None:
+                return
+            yield params
+
+    def record(self, params, result):
+        """Enregistre le résultat d'une requête ; remet en file un échec prioritaire"""
+        if result not in FAILED_RESULTS:
+            return
+
+        key = combination_key(params)
+        attempts = self.attempts.get(key, 0)
+        if priority_level(params) in self.retry_levels and attempts < self.max_retries:
+            self.attempts[key] = attempts + 1
+            self.retries += 1
+            self.push(params)
+
+    def remaining_by_priority(self):
+        """Combinaisons non traitées par niveau : {'critical': n, ...}"""
+        names = PRIORITY_LEVELS + ['autres']
+        return {name: len(level) for name, level in zip(names, self.levels) if len(level)}
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+Registre des colonnes ScanSante et chargement typé des CSV
+
+Les en-têtes varient d'un export à l'autre ("Nombre de séjours/séances total",
+"Nombre de séjoursséances total", "Age moyen" / "Âge moyen"...). Chaque
+en-tête est normalisé (minuscules, sans accents ni ponctuation) puis rapproché
+d'une colonne canonique du registre, qui fixe son nom et son type :
+
+    resolve("Nombre de séjoursséances total").key   -> 'sejours_total'
+
+read_csv lit un CSV nettoyé avec des types explicites (Finess en texte sur
+9 caractères, comptages en int32, Catégorie / Période en category) et
+usecols, via le moteur CSV de pyarrow s'il est installé : pas de
+ré-inférence des types à chaque fichier, mêmes dtypes pour tout le corpus.
+"""
+
+import csv
+import logging
+import re
+import unicodedata
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+# key : identifiant stable ; name : en-tête canonique ; kind : type de stockage
+# pattern : expression sur l'en-tête normalisé (voir normalize_header)
+Field = namedtuple('Field', 'key name kind pattern')
+
+FIELDS = [
+    Field('categorie', 'Catégorie', 'category', r'^categorie$'),
+    Field('finess', 'Finess', 'finess', r'^finess$'),
+    Field('raison_sociale', 'Raison Sociale', 'text', r'^raisonsociale$'),
+    Field('periode', 'Période', 'category', r'^periode$'),
+    Field('sejours_total', 'Nombre de séjours/séances total', 'count', r'^nombre.*total$'),
+    Field('hospit_complete', 'Nombre de séjours en hospit complète', 'count', r'^nombre.*complete$'),
+    Field('hospit_partielle', 'Nombre de séjours en hospit partielle', 'count', r'^nombre.*partielle$'),
+    Field('seances', 'Nombre de séances', 'count', r'^nombredeseances$'),
+    Field('sexe_ratio', 'Sexe ratio (% homme)', 'ratio', r'^sexeratio'),
+    Field('age_moyen', 'Age moyen', 'ratio', r'^agemoyen'),
+    Field('dms', 'Durée moyenne de séjour', 'ratio', r'^dureemoyenne'),
+    Field('deces', '% décès', 'ratio', r'^deces'),
+    Field('fichier_source', 'Fichier_Source', 'source', r'^fichiersource$'),
+]
+FIELDS_BY_KEY = {field.key: field for field in FIELDS}
+_PATTERNS = [(re.compile(field.pattern), field) for field in FIELDS]
+
+# Types pandas par kind ; les ratios restent au format texte d'origine ("59,6 %")
+DTYPES = {
+    'category': 'category',
+    'finess': 'str',
+    'text': 'str',
+    'count': 'int32',
+    'ratio': 'str',
+    'source': 'category',
+}
+
+
+def normalize_header(header):
+    """'Nombre de séjours/séances total' -> 'nombredesejoursseancestotal'"""
+    text = unicodedata.normalize('NFKD', header.strip().lower())
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return re.sub(r'[^0-9a-z]+', '', text)
+
+
+def resolve(header):
+    """Colonne canonique (Field) d'un en-tête, ou None s'il n'est pas reconnu"""
+    normalized = normalize_header(header)
+    for pattern, field in _PATTERNS:
+        if pattern.search(normalized):
+            return field
+    return None
+
+
+def canonical_headers(headers):
+    """{en-tête du fichier: Field} des en-têtes reconnus (premier en cas de doublon)"""
+    mapping, seen = {}, set()
+    for header in headers:
+        field = resolve(header)
+        if field is None:
+            continue
+        if field.key in seen:
+            logger.warning(f"Colonne en double pour {field.key}: '{header}' ignorée")
+            continue
+        seen.add(field.key)
+        mapping[header] = field
+    return mapping
+
+
+def canonical_names(headers):
+    """Noms canoniques d'une ligne d'en-têtes (l'en-tête d'origine s'il n'est pas reconnu)"""
+    mapping = canonical_headers(headers)
+    return [mapping[header].name if header in mapping else header for header in headers]
+
+
+def read_headers(path, encoding='utf-8-sig'):
+    with open(path, newline='', encoding=encoding) as f:
+        return next(csv.reader(f), [])
+
+
+def _selected(path, columns):
+    """(en-têtes à lire, {en-tête: Field}) selon columns (clés du registre, None = tout)"""
+    headers = read_headers(path)
+    mapping = canonical_headers(headers)
+    if columns is None:
+        unknown = [header for header in headers if header not in mapping]
+        if unknown:
+            logger.warning(f"En-têtes non reconnus dans {path}: {unknown}")
+        return headers, mapping
+    wanted = set(columns)
+    return [header for header, field in mapping.items() if field.key in wanted], mapping
+
+
+def read_table(path, columns=None, source=None):
+    """Lit un CSV nettoyé en pyarrow.Table aux colonnes canoniques et types explicites
+
+    columns : clés du registre à charger (include_columns), défaut : toutes ; les
+    colonnes non reconnues sont gardées en texte quand columns n'est pas donné
+    source : valeur d'une colonne Fichier_Source ajoutée au tableau
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pa_csv
+
+    arrow_types = {
+        'category': pa.dictionary(pa.int32(), pa.string()),
+        'finess': pa.string(),
+        'text': pa.string(),
+        'count': pa.int32(),
+        'ratio': pa.string(),
+        'source': pa.dictionary(pa.int32(), pa.string()),
+    }
+    usecols, mapping = _selected(path, columns)
+    types = {header: arrow_types[mapping[header].kind] if header in mapping else pa.string() for header in usecols}
+    table = pa_csv.read_csv(path, convert_options=pa_csv.ConvertOptions(
+        column_types=types, include_columns=usecols, strings_can_be_null=False
+    ))
+
+    arrays, names = [], []
+    for header, array in zip(table.column_names, table.columns):
+        field = mapping.get(header)
+        if field is not None and field.kind == 'finess':
+            # Texte dès la lecture : un CSV non nettoyé peut encore contenir des Finess sans zéro initial
+            array = pc.utf8_lpad(array, 9, padding='0')
+        arrays.append(array)
+        names.append(field.name if field else header)
+    if source is not None:
+        indices = pa.array([0] * len(table), type=pa.int32())
+        arrays.append(pa.DictionaryArray.from_arrays(indices, pa.array([source])))
+        names.append(FIELDS_BY_KEY['fichier_source'].name)
+    return pa.Table.from_arrays(arrays, names=names)
+
+
+def read_csv(path, columns=None):
+    """Comme read_table, en DataFrame (category / str / int32) ; sans pyarrow : moteur C de pandas"""
+    if _has_pyarrow():
+        return read_table(path, columns=columns).to_pandas()
+
+    import pandas as pd
+
+    usecols, mapping = _selected(path, columns)
+    dtype = {header: DTYPES[mapping[header].kind] if header in mapping else 'str' for header in usecols}
+    # Cellules vides gardées en '' comme avec pyarrow (strings_can_be_null=False)
+    df = pd.read_csv(path, usecols=usecols, dtype=dtype, encoding='utf-8-sig', keep_default_na=False)
+    for header in usecols:
+        if header in mapping and mapping[header].kind == 'finess':
+            df[header] = df[header].str.zfill(9)
+    return df.rename(columns={header: mapping[header].name for header in usecols if header in mapping})
+
+
+def read_corpus(paths, columns=None, source_column=True, sources=None):
+    """Concatène plusieurs CSV nettoyés en un DataFrame
+
+    Avec pyarrow, les tableaux sont concaténés côté Arrow puis convertis une
+    seule fois. source_column : ajoute Fichier_Source ; sources : ses valeurs
+    (même ordre que paths), par défaut le nom du fichier d'origine.
+    """
+    import os
+    import pandas as pd
+
+    paths = list(paths)
+    if not paths:
+        return pd.DataFrame()
+    sources = list(sources) if sources is not None else [os.path.basename(path) for path in paths]
+
+    if _has_pyarrow():
+        import pyarrow as pa
+
+        tables = [read_table(path, columns=columns, source=source if source_column else None)
+                  for path, source in zip(paths, sources)]
+        corpus = pa.concat_tables(tables, promote_options='permissive').to_pandas()
+    else:
+        frames = []
+        for path, source in zip(paths, sources):
+            df = read_csv(path, columns=columns)
+            if source_column:
+                df[FIELDS_BY_KEY['fichier_source'].name] = source
+            frames.append(df)
+        corpus = pd.concat(frames, ignore_index=True)
+
+    # Catégories fusionnées après concat (des dictionnaires différents donneraient des object)
+    for field in FIELDS:
+        if DTYPES[field.kind] == 'category' and field.name in corpus.columns:
+            corpus[field.name] = corpus[field.name].astype('category')
+    return corpus
+
+
+def _has_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
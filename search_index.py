@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+"""
+Index de recherche des établissements (Raison Sociale, Finess, Catégorie)
+
+- noms normalisés sans accents ni ponctuation ("Hôpital d'Arles" -> "HOPITAL D ARLES") ;
+- index de trigrammes : une requête de 3 caractères ou plus est l'intersection
+  des listes de ses trigrammes, confirmée par une recherche de sous-chaîne ;
+- Finess : recherche par préfixe dans une liste triée (bisect) ;
+- construction incrémentale : depuis le fichier consolidé (seules les lignes
+  ajoutées depuis la dernière lecture sont lues ; reconstruction complète si
+  le fichier a été réécrit) ou depuis l'arbre des CSV (seuls les fichiers
+  nouveaux ou modifiés sont relus) ;
+- mises à jour et recherches sous le même verrou (serveur multi-thread).
+
+Un établissement (Finess) est un document ; ses années et ses différents noms
+au fil des années y sont rattachés.
+"""
+
+import bisect
+import csv
+import hashlib
+import io
+import logging
+import os
+import re
+import threading
+import unicodedata
+
+import schema
+
+logger = logging.getLogger(__name__)
+
+YEAR_PATTERN = re.compile(r'(?:^|[/\\_])(\d{4})_')
+MIN_QUERY_LENGTH = 2
+# Octets relus pour reconnaître un fichier consolidé réécrit (début, et fin de la partie déjà lue)
+FINGERPRINT_BYTES = 4096
+
+
+def normalize(text):
+    """Majuscules sans accents, ponctuation remplacée par des espaces"""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(c for c in text if not unicodedata.combining(c)).upper()
+    return ' '.join(re.sub(r'[^0-9A-Z]+', ' ', text).split())
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _fingerprint(f, position):
+    """Empreinte des octets [0, position) d'un fichier : début et fin de la zone"""
+    digest = hashlib.sha1()
+    f.seek(0)
+    digest.update(f.read(min(position, FINGERPRINT_BYTES)))
+    f.seek(max(0, position - FINGERPRINT_BYTES))
+    digest.update(f.read(min(position, FINGERPRINT_BYTES)))
+    return digest.hexdigest()
+
+
+def source_year(source):
+    """Année d'un nom / chemin de fichier ('2024_tous_sejours.csv', 'cleaned_2023_...')"""
+    match = YEAR_PATTERN.search(source or '')
+    return match.group(1) if match else None
+
+
+class SearchIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self.documents = []          # [{'finess', 'raison_sociale', 'categorie', 'annees', 'noms'}]
+        self.by_finess = {}          # Finess -> id de document
+        self.postings = {}           # trigramme -> set(ids de document)
+        self.names = []              # id -> noms normalisés (texte de recherche)
+        self.sorted_finess = []      # Finess triés (recherche par préfixe)
+        self.entries = 0             # lignes établissement-année indexées
+        self._files = {}             # chemin -> (taille, mtime) déjà indexé
+        self._consolidated = None    # (chemin, position, empreinte, en-têtes) du fichier consolidé
+
+    def __len__(self):
+        return len(self.documents)
+
+    def add(self, finess, name, categorie='', year=None):
+        """Ajoute une ligne établissement-année ; False pour une ligne sans Finess (Total)"""
+        finess = (finess or '').strip()
+        if not finess:
+            return False
+        finess = finess.zfill(9)
+        name = (name or '').strip()
+        self.entries += 1
+
+        doc_id = self.by_finess.get(finess)
+        if doc_id is None:
+            doc_id = len(self.documents)
+            self.by_finess[finess] = doc_id
+            self.documents.append({'finess': finess, 'raison_sociale': name, 'categorie': categorie,
+                                   'annees': set(), 'noms': set()})
+            self.names.append('')
+
+        document = self.documents[doc_id]
+        if year:
+            # Nom et catégorie affichés : ceux de l'année la plus récente
+            if not document['annees'] or year >= max(document['annees']):
+                document['raison_sociale'] = name or document['raison_sociale']
+                document['categorie'] = categorie or document['categorie']
+            document['annees'].add(year)
+
+        normalized = normalize(name)
+        if normalized and normalized not in document['noms']:
+            document['noms'].add(normalized)
+            self.names[doc_id] = ' | '.join(sorted(document['noms']))
+            for trigram in trigrams(normalized):
+                self.postings.setdefault(trigram, set()).add(doc_id)
+        return True
+
+    def add_rows(self, headers, rows, year=None):
+        """Indexe des lignes CSV (en-têtes Catégorie, Finess, Raison Sociale[, Fichier_Source])"""
+        # Colonnes repérées par le registre (variantes d'en-têtes comprises)
+        fields = [schema.resolve(header) for header in headers]
+        positions = {field.key: j for j, field in enumerate(fields) if field}
+        finess_idx = positions.get('finess')
+        name_idx = positions.get('raison_sociale')
+        category_idx = positions.get('categorie')
+        source_idx = positions.get('fichier_source')
+        if finess_idx is None or name_idx is None:
+            return 0
+
+        count = 0
+        for row in rows:
+            if len(row) <= max(finess_idx, name_idx):
+                continue
+            row_year = source_year(row[source_idx]) if source_idx is not None and source_idx < len(row) else year
+            category = row[category_idx] if category_idx is not None else ''
+            count += self.add(row[finess_idx], row[name_idx], category, row_year)
+        return count
+
+    def update_from_consolidated(self, path):
+        """Indexe les lignes ajoutées au fichier consolidé depuis la dernière lecture
+
+        create_consolidated_file et stream_consolidate réécrivent le fichier sur
+        place (même inode) : la partie déjà lue est reconnue à son empreinte
+        (premiers octets et derniers octets avant la position de reprise) ; si
+        elle a changé, ou si le fichier est plus court, l'index est reconstruit.
+        Retourne le nombre de lignes indexées.
+        """
+        with self._lock:
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                return 0
+
+            with open(path, 'rb') as f:
+                previous = self._consolidated
+                if (previous and previous[0] == path and previous[1] <= size
+                        and _fingerprint(f, previous[1]) == previous[2]):
+                    position, headers = previous[1], previous[3]
+                else:
+                    if previous:
+                        logger.info(f"Index de recherche: {path} réécrit, reconstruction complète")
+                        self.clear()
+                    position, headers = 0, None
+                if position == size:
+                    return 0
+
+                f.seek(position)
+                chunk = f.read(size - position)
+                # Lignes complètes uniquement (le fichier peut être en cours d'écriture)
+                end = chunk.rfind(b'\n') + 1
+                text = chunk[:end].decode('utf-8-sig' if position == 0 else 'utf-8')
+                reader = csv.reader(io.StringIO(text))
+                if headers is None:
+                    headers = next(reader, None)
+                    if headers is None:
+                        return 0
+
+                count = self.add_rows(headers, reader)
+                self._consolidated = (path, position + end, _fingerprint(f, position + end), headers)
+            self._refresh_sorted()
+        if count:
+            logger.info(f"Index de recherche: {count:,} lignes ajoutées depuis {path} ({len(self):,} établissements)")
+        return count
+
+    def update_from_tree(self, directory):
+        """Indexe les CSV nouveaux ou modifiés d'un arbre (bruts ou nettoyés)"""
+        count = 0
+        with self._lock:
+            for root, _, files in os.walk(directory):
+                for name in sorted(files):
+                    if not name.endswith('.csv'):
+                        continue
+                    path = os.path.join(root, name)
+                    stat = os.stat(path)
+                    state = (stat.st_size, stat.st_mtime_ns)
+                    if self._files.get(path) == state:
+                        continue
+                    with open(path, newline='', encoding='utf-8-sig') as f:
+                        reader = csv.reader(f)
+                        headers = next(reader, None)
+                        if headers:
+                            count += self.add_rows(headers, reader, year=source_year(name))
+                    self._files[path] = state
+            self._refresh_sorted()
+        if count:
+            logger.info(f"Index de recherche: {count:,} lignes ajoutées depuis {directory} ({len(self):,} établissements)")
+        return count
+
+    def _refresh_sorted(self):
+        if len(self.sorted_finess) != len(self.by_finess):
+            self.sorted_finess = sorted(self.by_finess)
+
+    def _finess_matches(self, prefix):
+        start = bisect.bisect_left(self.sorted_finess, prefix)
+        for finess in self.sorted_finess[start:]:
+            if not finess.startswith(prefix):
+                break
+            yield self.by_finess[finess]
+
+    def _name_matches(self, query):
+        if len(query) < 3:
+            candidates = range(len(self.documents))
+        else:
+            postings = sorted((self.postings.get(t, set()) for t in trigrams(query)), key=len)
+            if not postings or not postings[0]:
+                return []
+            candidates = set.intersection(*postings)
+        return [doc_id for doc_id in candidates if query in self.names[doc_id]]
+
+    def search(self, query, limit=10, categorie=None):
+        """Établissements correspondant à query (nom partiel sans accents ou début de Finess)
+
+        Tri : nom commençant par la requête, puis mot commençant par la requête,
+        puis année la plus récente, puis ordre alphabétique.
+        """
+        query = normalize(query)
+        if len(query) < MIN_QUERY_LENGTH:
+            return []
+
+        # Verrou : une mise à jour concurrente modifie postings et les années des documents
+        with self._lock:
+            return self._search(query, limit, categorie)
+
+    def _search(self, query, limit, categorie):
+        if query.replace(' ', '').isdigit() or (query[:2] in ('2A', '2B') and query[2:].isdigit()):
+            matches = list(self._finess_matches(query.replace(' ', '')))
+        else:
+            matches = self._name_matches(query)
+
+        if categorie:
+            matches = [doc_id for doc_id in matches if self.documents[doc_id]['categorie'] == categorie]
+
+        def rank(doc_id):
+            name = self.names[doc_id]
+            document = self.documents[doc_id]
+            latest = max(document['annees']) if document['annees'] else ''
+            return (not name.startswith(query), f" {query}" not in f" {name}",
+                    -int(latest or 0), document['raison_sociale'])
+
+        results = []
+        for doc_id in sorted(matches, key=rank)[:limit]:
+            document = self.documents[doc_id]
+            results.append({
+                'finess': document['finess'],
+                'raison_sociale': document['raison_sociale'],
+                'categorie': document['categorie'],
+                'annees': sorted(document['annees']),
+            })
+        return results
@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+"""
+Fusion des sorties de plusieurs runs de scraping (shards, machines, conteneurs)
+
+Chaque run produit son propre arbre donnees_scansante (et son manifest.jsonl).
+La fusion :
+1. unit les arbres / manifestes (CSV nettoyés du mode fusionné 'clean' compris),
+2. résout les doublons par empreinte SHA-256 puis horodatage le plus récent
+   (à défaut : nombre de lignes puis ordre des arbres, conflit non résolu),
+3. vérifie la complétude par rapport à la liste de combinaisons planifiée,
+4. écrit l'arbre fusionné, son manifeste et un fichier consolidé (et son
+   instantané binaire) en une seule passe ligne à ligne, sans charger les
+   données dans pandas.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+from datetime import datetime
+
+from final_automation import MANIFEST_FILENAME, ScanSanteFinalAutomation, cleaned_tree, combination_key
+
+logger = logging.getLogger(__name__)
+
+
+def file_sha256(path, chunk_size=1 << 16):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def entry_rank(entry):
+    """Ordre de préférence des entrées d'une même combinaison
+
+    Une entrée scrapée l'emporte sur une entrée déduite localement
+    (origin='derived'), puis la plus récente l'emporte.
+    """
+    return entry.get('origin') != 'derived', entry['scraped_at']
+
+
+def load_manifest(tree):
+    """Lit le manifeste d'un arbre : {clé de combinaison: entrée retenue (entry_rank)}"""
+    entries = {}
+    path = os.path.join(tree, MANIFEST_FILENAME)
+    if not os.path.exists(path):
+        return entries
+
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            entry = json.loads(line)
+            previous = entries.get(entry['key'])
+            if previous is None or entry_rank(entry) >= entry_rank(previous):
+                entries[entry['key']] = entry
+    return entries
+
+
+def _csv_files(tree):
+    """CSV d'un arbre : [(chemin complet, chemin relatif séparé par '/')]"""
+    files = []
+    for root, _, names in os.walk(tree):
+        for name in names:
+            if name.endswith('.csv'):
+                full_path = os.path.join(root, name)
+                files.append((full_path, os.path.relpath(full_path, tree).replace(os.sep, '/')))
+    return files
+
+
+def collect_files(tree, manifest):
+    """Inventaire des CSV d'un arbre : {chemin relatif du brut: candidat}
+
+    L'empreinte et l'horodatage viennent du manifeste quand il existe ; sinon
+    ils sont calculés depuis le fichier (SHA-256 en flux, date de modification).
+    Une combinaison sans CSV brut (mode fusionné 'clean') est reprise de l'arbre
+    nettoyé associé (cleaned_tree) : candidat marqué 'cleaned'.
+    """
+    import data_cleaner
+
+    by_path = {(entry['path'], bool(entry.get('cleaned'))): entry
+               for entry in manifest.values() if entry.get('path')}
+    candidates = {}
+    inventories = [(tree, False)]
+    if os.path.isdir(cleaned_tree(tree)):
+        inventories.append((cleaned_tree(tree), True))
+
+    for root, cleaned in inventories:
+        for full_path, file_path in _csv_files(root):
+            relative_path = data_cleaner.source_label(full_path, root) if cleaned else file_path
+            if relative_path in candidates:
+                # Version nettoyée d'un CSV brut présent : le brut fait foi
+                continue
+            entry = by_path.get((file_path, cleaned))
+            if cleaned and entry is None:
+                # Arbre nettoyé d'un run classique : seuls les CSV du mode 'clean' sont repris
+                continue
+
+            manifest_date = bool(entry and entry.get('sha256'))
+            if manifest_date:
+                sha256, timestamp = entry['sha256'], entry['scraped_at']
+            else:
+                sha256 = file_sha256(full_path)
+                timestamp = datetime.fromtimestamp(os.path.getmtime(full_path)).isoformat(timespec='seconds')
+
+            candidates[relative_path] = {
+                'source': full_path,
+                'tree': tree,
+                'file': file_path,
+                'cleaned': cleaned,
+                'sha256': sha256,
+                'scraped_at': timestamp,
+                # Date de modification : sans valeur après une copie, ne départage pas un conflit
+                'manifest_date': manifest_date,
+                'key': entry['key'] if entry else None,
+                'rows': entry['rows'] if entry else None,
+                'status': entry['status'] if entry else 'ok',
+                'reconciliation': entry.get('reconciliation') if entry else None,
+                'origin': entry.get('origin', 'scrape') if entry else 'scrape',
+            }
+    return candidates
+
+
+def row_count(candidate):
+    """Lignes de données d'un candidat (manifeste, sinon comptées dans le fichier)"""
+    if candidate['rows'] is None:
+        with open(candidate['source'], 'rb') as f:
+            candidate['rows'] = max(0, sum(1 for _ in f) - 1)
+    return candidate['rows']
+
+
+def conflict_winner(current, candidate):
+    """Version retenue entre deux contenus différents d'un même fichier : (version, résolu)
+
+    Une version rapprochée de sa ligne Total l'emporte sur une version en écart,
+    puis la plus récente d'après les manifestes. Horodatages égaux (précision
+    d'une seconde) ou issus des dates de modification : départage déterministe
+    par nombre de lignes puis ordre des arbres, et le conflit reste non résolu.
+    """
+    if (current['status'] != 'mismatch') != (candidate['status'] != 'mismatch'):
+        return (current if current['status'] != 'mismatch' else candidate), True
+    if current['manifest_date'] and candidate['manifest_date'] and current['scraped_at'] != candidate['scraped_at']:
+        return max(current, candidate, key=lambda c: c['scraped_at']), True
+    return max(current, candidate, key=lambda c: (row_count(c), -c['order'])), False
+
+
+def resolve_duplicates(trees):
+    """Union des arbres ; un seul candidat par chemin relatif
+
+    Contenus identiques (même SHA-256) : doublon simple, le premier est gardé.
+    Contenus différents : voir conflict_winner (conflit journalisé).
+    Retourne (fichiers retenus, manifestes fusionnés, statistiques).
+    """
+    selected = {}
+    statuses = {}
+    stats = {'files': 0, 'duplicates': 0, 'conflicts': 0, 'unresolved': 0}
+
+    for order, tree in enumerate(trees):
+        manifest = load_manifest(tree)
+        for key, entry in manifest.items():
+            previous = statuses.get(key)
+            if previous is None or entry_rank(entry) >= entry_rank(previous):
+                statuses[key] = entry
+
+        for relative_path, candidate in collect_files(tree, manifest).items():
+            stats['files'] += 1
+            candidate['order'] = order
+            current = selected.get(relative_path)
+            if current is None:
+                selected[relative_path] = candidate
+            elif current['sha256'] == candidate['sha256']:
+                stats['duplicates'] += 1
+                if current['key'] is None:
+                    current['key'] = candidate['key']
+            else:
+                stats['conflicts'] += 1
+                winner, resolved = conflict_winner(current, candidate)
+                if resolved:
+                    logger.warning(f"Conflit sur {relative_path}: {current['tree']} vs {candidate['tree']} "
+                                   f"- version retenue: {winner['tree']} ({winner['scraped_at']})")
+                else:
+                    stats['unresolved'] += 1
+                    logger.warning(f"Conflit non résolu sur {relative_path}: {current['tree']} vs "
+                                   f"{candidate['tree']} (horodatages non départageants) - version retenue: "
+                                   f"{winner['tree']} ({row_count(winner)} lignes)")
+                # Un arbre sans manifeste ne connaît pas la clé de combinaison
+                selected[relative_path] = dict(winner, key=winner['key'] or current['key'] or candidate['key'])
+
+    return selected, statuses, stats
+
+
+def check_completeness(selected, statuses, planned, automation):
+    """Combinaisons planifiées sans fichier ni statut 'empty'/'minimal' connu"""
+    missing = []
+    for params in planned:
+        relative_path = os.path.relpath(
+            os.path.join(automation.get_organized_filepath(params), automation.generate_filename(params)),
+            automation.output_dir
+        ).replace(os.sep, '/')
+        if relative_path in selected:
+            continue
+        entry = statuses.get(combination_key(params))
+        if entry and entry['status'] in ('empty', 'minimal'):
+            continue
+        missing.append(params)
+    return missing
+
+
+def merge_trees(trees, output_dir, planned=None, consolidated_file=None):
+    """Fusionne plusieurs arbres de sortie dans output_dir
+
+    planned : liste de combinaisons attendues (vérification de complétude)
+    consolidated_file : si fourni, fichier consolidé nettoyé écrit en une passe
+    Retourne un dict de synthèse (fichiers, doublons, conflits, manquants, lignes).
+    """
+    import data_cleaner
+
+    output_abs = os.path.abspath(output_dir)
+    selected, statuses, stats = resolve_duplicates(trees)
+    logger.info(f"Fusion de {len(trees)} arbres: {stats['files']} fichiers, "
+                f"{stats['duplicates']} doublons identiques, {stats['conflicts']} conflits "
+                f"(dont {stats['unresolved']} non résolus)")
+
+    # Arbre fusionné + manifeste
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, MANIFEST_FILENAME)
+    merged_keys = set()
+    tmp = manifest_path + '.tmp'
+    try:
+        with open(tmp, 'w', encoding='utf-8') as manifest:
+            for relative_path in sorted(selected):
+                candidate = selected[relative_path]
+                # CSV nettoyé (mode fusionné 'clean') : recopié dans l'arbre nettoyé de la sortie
+                destination = os.path.join(cleaned_tree(output_dir) if candidate['cleaned'] else output_dir,
+                                           candidate['file'])
+                if os.path.abspath(candidate['source']) != os.path.abspath(destination):
+                    os.makedirs(os.path.dirname(destination), exist_ok=True)
+                    shutil.copy2(candidate['source'], destination)
+
+                entry = {
+                    'key': candidate['key'],
+                    'status': candidate['status'],
+                    'path': candidate['file'],
+                    'rows': candidate['rows'],
+                    'sha256': candidate['sha256'],
+                    'reconciliation': candidate['reconciliation'],
+                    'origin': candidate['origin'],
+                    'cleaned': candidate['cleaned'],
+                    'scraped_at': candidate['scraped_at']
+                }
+                manifest.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                if candidate['key']:
+                    merged_keys.add(candidate['key'])
+
+            # Statuts sans fichier (zones vides / données minimales)
+            for key, entry in sorted(statuses.items()):
+                if key not in merged_keys and entry['status'] in ('empty', 'minimal'):
+                    manifest.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        os.replace(tmp, manifest_path)
+    except Exception:
+        # Fusion interrompue (copie, lecture...) : pas de manifeste partiel laissé derrière
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+    summary = dict(stats, merged=len(selected), missing=[], rows=0)
+
+    if planned is not None:
+        automation = ScanSanteFinalAutomation(output_dir=output_abs)
+        summary['missing'] = check_completeness(selected, statuses, planned, automation)
+        logger.info(f"Complétude: {len(planned) - len(summary['missing'])}/{len(planned)} combinaisons planifiées")
+        for params in summary['missing'][:20]:
+            logger.warning(f"Manquant: {combination_key(params)}")
+
+    if consolidated_file:
+        # clean_rows est idempotent : les CSV déjà nettoyés passent par le même flux
+        sources = [(os.path.join(cleaned_tree(output_dir) if selected[path]['cleaned'] else output_dir,
+                                 selected[path]['file']), path) for path in sorted(selected)]
+        summary['rows'] = data_cleaner.stream_consolidate(sources, consolidated_file, clean=True,
+                                                          with_snapshot=True)
+        ScanSanteFinalAutomation(output_dir=output_abs).build_dashboard_aggregates()
+
+    return summary
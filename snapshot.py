@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+"""
+Instantané binaire du fichier consolidé, lisible par mmap sans parsing
+
+Écrit à la fin de la consolidation à côté du CSV (scansante_master_cleaned.snap).
+Un seul fichier :
+
+    SCSNAP1\\n | longueur de l'en-tête (uint64) | en-tête JSON | blocs alignés sur 64 octets
+
+(positions des blocs relatives au début de la zone de données, elle-même alignée)
+
+- comptages : int32 ; ratios ("59,6 %", "62,42") : float32, NaN si absent ;
+- textes (Catégorie, Finess, Raison Sociale, Période, Fichier_Source...) :
+  codes int32 (-1 si vide) + dictionnaire de chaînes (un tampon UTF-8 et ses
+  offsets int64).
+
+write_snapshot part d'un DataFrame ; SnapshotWriter construit le même fichier
+ligne à ligne (consolidation en flux, sans charger le consolidé dans pandas).
+
+Snapshot(path) projette le fichier en mémoire (lecture seule) : les colonnes
+sont des vues NumPy sur la projection, sans copie ni décodage. Plusieurs
+processus (workers WSGI) qui ouvrent le même fichier partagent les mêmes pages
+du cache du système.
+"""
+
+import array
+import json
+import os
+import re
+import struct
+
+import numpy as np
+
+import schema
+
+MAGIC = b'SCSNAP1\n'
+ALIGNMENT = 64
+SNAPSHOT_EXTENSION = '.snap'
+# Séparateurs de milliers (espaces, insécables) et signe % retirés avant conversion d'un ratio
+# (caractères littéraux : le motif sert aussi au moteur d'expressions de pyarrow)
+_RATIO_NOISE = re.compile('[\\s%\u202f\xa0]')
+
+
+def snapshot_path(consolidated_file):
+    """Chemin de l'instantané d'un fichier consolidé (même nom, extension .snap)"""
+    return os.path.splitext(consolidated_file)[0] + SNAPSHOT_EXTENSION
+
+
+def _ratio_values(series):
+    """Texte des ratios ("59,6 %", "1 234,5") -> float32 (NaN si non numérique)"""
+    import pandas as pd
+
+    text = series.astype(str).str.replace(_RATIO_NOISE.pattern, '', regex=True).str.replace(',', '.')
+    return pd.to_numeric(text, errors='coerce').to_numpy(dtype=np.float32)
+
+
+def ratio_value(text):
+    """Un ratio texte -> float (NaN si non numérique), comme _ratio_values"""
+    try:
+        return float(_RATIO_NOISE.sub('', str(text)).replace(',', '.'))
+    except ValueError:
+        return float('nan')
+
+
+def _encode_strings(values):
+    """(tampon UTF-8, offsets int64) d'une liste de chaînes"""
+    encoded = [value.encode('utf-8') for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+
+def _dictionary_encode(series):
+    """(codes int32, tampon UTF-8, offsets int64) ; les vides sont codés -1"""
+    import pandas as pd
+
+    values = series.astype(str).where(series.notna() & (series.astype(str) != ''), None)
+    codes, uniques = pd.factorize(values, use_na_sentinel=True)
+    buffer, offsets = _encode_strings(list(uniques))
+    return codes.astype(np.int32), buffer, offsets
+
+
+def write_snapshot(df, path, source=None):
+    """Écrit un DataFrame consolidé en instantané (écriture atomique) ; retourne le chemin"""
+    blocks = []
+    columns = []
+
+    def add_block(array):
+        blocks.append(np.ascontiguousarray(array))
+        return len(blocks) - 1
+
+    for name in df.columns:
+        field = schema.resolve(name)
+        kind = field.kind if field else 'text'
+        series = df[name]
+        if kind == 'count':
+            values = series.to_numpy(dtype=np.int64, na_value=0).astype(np.int32)
+            columns.append({'name': name, 'kind': kind, 'values': add_block(values)})
+        elif kind == 'ratio':
+            percent = bool(series.astype(str).str.endswith('%').any())
+            columns.append({'name': name, 'kind': kind, 'percent': percent,
+                            'values': add_block(_ratio_values(series))})
+        else:
+            codes, buffer, offsets = _dictionary_encode(series)
+            columns.append({'name': name, 'kind': kind, 'codes': add_block(codes),
+                            'buffer': add_block(buffer), 'offsets': add_block(offsets)})
+
+    return _write_file(path, len(df), source, columns, blocks)
+
+
+def _write_file(path, n_rows, source, columns, blocks):
+    """En-tête JSON + blocs alignés, écrits dans un fichier temporaire puis renommé"""
+    layout, position = [], 0
+    for array in blocks:
+        layout.append({'dtype': array.dtype.str, 'count': int(array.size), 'offset': position})
+        position = _align(position + array.nbytes)
+    header = {'n_rows': int(n_rows), 'source': source, 'columns': columns, 'blocks': layout}
+    header_bytes = json.dumps(header, ensure_ascii=False).encode('utf-8')
+    data_start = _align(len(MAGIC) + 8 + len(header_bytes))
+
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<Q', len(header_bytes)))
+        f.write(header_bytes)
+        for block, array in zip(layout, blocks):
+            f.seek(data_start + block['offset'])
+            f.write(array.tobytes())
+        f.truncate(data_start + position)
+    os.replace(tmp, path)
+    return path
+
+
+class SnapshotWriter:
+    """Instantané construit ligne à ligne, sans DataFrame
+
+    Comptages et ratios accumulés dans des array('i') / array('f'), textes
+    codés au fil de l'eau (dictionnaire valeur -> code, dans l'ordre
+    d'apparition) : le fichier écrit est le même qu'avec write_snapshot.
+
+        writer = SnapshotWriter(headers)
+        for row in rows:
+            writer.add_row(row)
+        writer.write(path, source='scansante_master_cleaned.csv')
+    """
+
+    def __init__(self, headers):
+        self.headers = list(headers)
+        self.n_rows = 0
+        self._columns = []
+        for name in self.headers:
+            field = schema.resolve(name)
+            kind = field.kind if field else 'text'
+            if kind == 'count':
+                self._columns.append({'name': name, 'kind': kind, 'values': array.array('i')})
+            elif kind == 'ratio':
+                self._columns.append({'name': name, 'kind': kind, 'values': array.array('f'), 'percent': False})
+            else:
+                self._columns.append({'name': name, 'kind': kind, 'codes': array.array('i'), 'dictionary': {}})
+
+    def __len__(self):
+        return self.n_rows
+
+    def add_row(self, row):
+        """Ajoute une ligne (cellules texte, ou comptages déjà convertis en int)"""
+        for j, column in enumerate(self._columns):
+            cell = row[j] if j < len(row) else ''
+            kind = column['kind']
+            if kind == 'count':
+                try:
+                    value = int(cell or 0)
+                except (TypeError, ValueError):
+                    value = 0
+                column['values'].append(value)
+            elif kind == 'ratio':
+                column['values'].append(ratio_value(cell))
+                if not column['percent'] and str(cell).endswith('%'):
+                    column['percent'] = True
+            else:
+                text = str(cell)
+                if text:
+                    dictionary = column['dictionary']
+                    column['codes'].append(dictionary.setdefault(text, len(dictionary)))
+                else:
+                    column['codes'].append(-1)
+        self.n_rows += 1
+
+    def write(self, path, source=None):
+        """Écrit l'instantané (écriture atomique) ; retourne le chemin"""
+        blocks = []
+        columns = []
+
+        def add_block(values, dtype):
+            blocks.append(np.frombuffer(values, dtype=dtype) if isinstance(values, array.array)
+                          else np.ascontiguousarray(values, dtype=dtype))
+            return len(blocks) - 1
+
+        for column in self._columns:
+            name, kind = column['name'], column['kind']
+            if kind == 'count':
+                columns.append({'name': name, 'kind': kind, 'values': add_block(column['values'], np.int32)})
+            elif kind == 'ratio':
+                columns.append({'name': name, 'kind': kind, 'percent': column['percent'],
+                                'values': add_block(column['values'], np.float32)})
+            else:
+                buffer, offsets = _encode_strings(list(column['dictionary']))
+                columns.append({'name': name, 'kind': kind, 'codes': add_block(column['codes'], np.int32),
+                                'buffer': add_block(buffer, np.uint8), 'offsets': add_block(offsets, np.int64)})
+
+        return _write_file(path, self.n_rows, source, columns, blocks)
+
+
+def _align(position):
+    return (position + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+class Snapshot:
+    """Instantané projeté en mémoire ; colonnes en vues NumPy sans copie"""
+
+    def __init__(self, path):
+        self.path = path
+        self._map = np.memmap(path, dtype=np.uint8, mode='r')
+        if bytes(self._map[:len(MAGIC)]) != MAGIC:
+            raise ValueError(f"{path} n'est pas un instantané ScanSante")
+        (header_size,) = struct.unpack('<Q', bytes(self._map[len(MAGIC):len(MAGIC) + 8]))
+        start = len(MAGIC) + 8
+        header = json.loads(bytes(self._map[start:start + header_size]).decode('utf-8'))
+        self._data_start = _align(start + header_size)
+        self.n_rows = header['n_rows']
+        self.source = header.get('source')
+        self._blocks = header['blocks']
+        self._columns = {column['name']: column for column in header['columns']}
+        self.columns = [column['name'] for column in header['columns']]
+        self._dictionaries = {}
+
+    def __len__(self):
+        return self.n_rows
+
+    def _block(self, index):
+        block = self._blocks[index]
+        dtype = np.dtype(block['dtype'])
+        start = self._data_start + block['offset']
+        return self._map[start:start + block['count'] * dtype.itemsize].view(dtype)
+
+    def kind(self, name):
+        return self._columns[name]['kind']
+
+    def values(self, name):
+        """Valeurs d'une colonne numérique, ou codes (int32, -1 = vide) d'une colonne texte"""
+        column = self._columns[name]
+        return self._block(column['values'] if 'values' in column else column['codes'])
+
+    def dictionary(self, name):
+        """Chaînes d'une colonne texte (décodées à la première demande)"""
+        if name not in self._dictionaries:
+            column = self._columns[name]
+            buffer = bytes(self._block(column['buffer']))
+            offsets = self._block(column['offsets']).tolist()
+            self._dictionaries[name] = [buffer[offsets[i]:offsets[i + 1]].decode('utf-8')
+                                        for i in range(len(offsets) - 1)]
+        return self._dictionaries[name]
+
+    def to_dataframe(self, columns=None):
+        """DataFrame des colonnes demandées : numériques sans copie, textes en category"""
+        import pandas as pd
+
+        data = {}
+        for name in columns or self.columns:
+            column = self._columns[name]
+            if 'codes' in column:
+                data[name] = pd.Categorical.from_codes(self.values(name), categories=self.dictionary(name))
+            else:
+                # Series par colonne : pas de consolidation en bloc 2D (qui copierait)
+                data[name] = pd.Series(self.values(name), copy=False)
+        return pd.DataFrame(data, copy=False)
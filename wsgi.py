@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Point d'entrée WSGI de production du tableau de bord
+
+    gunicorn -w 4 --threads 8 -b 0.0.0.0:5000 wsgi:app
+    python wsgi.py --workers 4 --threads 8       # même chose, sans ligne gunicorn
+
+Plusieurs processus (workers) et plusieurs threads par worker : un
+téléchargement du consolidé ou du ZIP n'empêche plus les autres requêtes
+(/api/status...). L'état de la collecte est partagé entre workers par
+job_state (SQLite) ; les caches (agrégats, index de recherche) sont propres à
+chaque worker et se mettent à jour seuls.
+
+Sans gunicorn (Windows...), python wsgi.py se rabat sur le serveur Werkzeug
+multi-thread dans un seul processus.
+"""
+
+import argparse
+
+from app import app
+
+
+def serve_gunicorn(host, port, workers, threads):
+    from gunicorn.app.base import BaseApplication
+
+    class DashboardApplication(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', f"{host}:{port}")
+            self.cfg.set('workers', workers)
+            self.cfg.set('threads', threads)
+            self.cfg.set('worker_class', 'gthread')
+            # Collecte : thread de fond dans un worker, pas de redémarrage périodique
+            self.cfg.set('max_requests', 0)
+            self.cfg.set('timeout', 120)
+
+        def load(self):
+            return app
+
+    DashboardApplication().run()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tableau de bord ScanSante (production)")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=4, help="processus WSGI")
+    parser.add_argument('--threads', type=int, default=8, help="threads par processus")
+    args = parser.parse_args(argv)
+
+    try:
+        import gunicorn  # noqa: F401
+    except ImportError:
+        from werkzeug.serving import run_simple
+
+        print("gunicorn non installé : serveur Werkzeug multi-thread (un seul processus)")
+        run_simple(args.host, args.port, app, threaded=True)
+        return 0
+
+    serve_gunicorn(args.host, args.port, args.workers, args.threads)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())